@@ -42,4 +42,10 @@ def create_app():
     from . import message
     app.register_blueprint(message.message_bp)
 
+    from .commands import register_commands
+    register_commands(app)
+
+    from .cleanup import register_cleanup_sweep
+    register_cleanup_sweep(app)
+
     return app
\ No newline at end of file
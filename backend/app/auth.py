@@ -7,6 +7,8 @@ from google.auth.transport import requests
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from .model import User
 from . import bcrypt
+from .versions import USERS_VERSION, bump_version
+from .cache import get_spot_cache
 
 
 
@@ -180,6 +182,8 @@ def update_profile():
         
     try:
         user.save()
+        bump_version(USERS_VERSION) #names and pictures appear in spot, comment and message lists
+        get_spot_cache().users_changed()
         return jsonify({"message": "Profile updated successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,136 @@
+#bulk spot imports for POST /api/parking/spots/bulk and `flask import-spots`
+#rows come from csv or geojson, are validated one by one and written with
+#insert_many, the derived data (clusters, tag counts, search index, caches)
+#is then updated once per batch instead of once per spot
+import csv
+import io
+import json
+from collections import Counter
+from datetime import datetime
+from bson import ObjectId
+from flask import current_app
+from mongoengine.errors import ValidationError
+from pymongo.errors import BulkWriteError
+from .model import ParkingSpot
+from . import clusters
+from . import search
+from . import tags
+from .cache import get_spot_cache
+from .feed_cache import get_feed_cache
+from .versions import SPOTS_VERSION, bump_version
+
+FORMATS = ('csv', 'geojson')
+
+
+def parse_csv(text):
+    #header row with title,address,lat,lng and optionally description,url_for_images,tags
+    try:
+        return [dict(row) for row in csv.DictReader(io.StringIO(text))]
+    except csv.Error as e:
+        raise ValueError(str(e))
+
+
+def parse_geojson(text):
+    #a FeatureCollection of Points, the other columns are feature properties
+    data = json.loads(text) if isinstance(text, str) else text
+    if not isinstance(data, dict) or data.get("type") != "FeatureCollection":
+        raise ValueError("expected a GeoJSON FeatureCollection")
+    features = data.get("features") or []
+    if not isinstance(features, list):
+        raise ValueError("features must be an array")
+    rows = []
+    for feature in features:
+        properties = feature.get("properties") or {} if isinstance(feature, dict) else None
+        geometry = feature.get("geometry") or {} if isinstance(feature, dict) else None
+        if not isinstance(properties, dict) or not isinstance(geometry, dict):
+            rows.append(None) #keeps the row numbers, import_spots reports it as an invalid row
+            continue
+        row = dict(properties)
+        if geometry.get("type") == "Point" and len(geometry.get("coordinates") or []) >= 2:
+            row["lng"], row["lat"] = geometry["coordinates"][:2]
+        rows.append(row)
+    return rows
+
+
+def parse_rows(text, fmt):
+    #ValueError when the payload as a whole cannot be read
+    if fmt == 'csv':
+        return parse_csv(text)
+    if fmt == 'geojson':
+        return parse_geojson(text)
+    raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+
+def _build_spot(row, owner, now):
+    #same fields and defaults as create_parking_spot, raises ValueError/ValidationError
+    if not isinstance(row, dict):
+        raise ValueError("Row is not an object")
+    for field in ('title', 'address', 'lat', 'lng'):
+        if row.get(field) in (None, ''):
+            raise ValueError(f"Missing required field: {field}")
+    lat, lng = float(row['lat']), float(row['lng'])
+    if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        raise ValueError("lat/lng out of range")
+    row_tags = row.get('tags') or []
+    spot = ParkingSpot(
+        id=ObjectId(),
+        title=row['title'],
+        description=row.get('description') or '',
+        address=row['address'],
+        url_for_images=row.get('url_for_images') or '',
+        tags=row_tags.split() if isinstance(row_tags, str) else list(row_tags),
+        owner=owner,
+        lat=lat,
+        lng=lng,
+        location=[lng, lat],
+        created_at=now,
+        updated_at=now,
+    )
+    spot.validate()
+    return spot
+
+
+def import_spots(rows, owner, batch_size=1000):
+    #returns {"inserted": n, "errors": [{"row": i, "error": message}]}, rows are numbered from 1
+    collection = ParkingSpot._get_collection()
+    now = datetime.now()
+    inserted = 0
+    errors = []
+    batch = []
+
+    def flush():
+        nonlocal inserted
+        written = list(batch)
+        try:
+            collection.insert_many([spot.to_mongo() for _, spot in batch], ordered=False)
+        except BulkWriteError as e:
+            #unordered, so everything but the failed rows was still written
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            for error in e.details.get("writeErrors", []):
+                errors.append({"row": batch[error["index"]][0], "error": error.get("errmsg", "write failed")})
+            written = [item for index, item in enumerate(batch) if index not in failed]
+        spots = [spot for _, spot in written]
+        clusters.add_spots(spots)
+        tags.add_tag_counts(Counter(tag for spot in spots for tag in set(spot.tags)))
+        for spot in spots:
+            search.index_spot(spot)
+        inserted += len(spots)
+        batch.clear()
+
+    for number, row in enumerate(rows, start=1):
+        try:
+            batch.append((number, _build_spot(row, owner, now)))
+        except (ValueError, TypeError, ValidationError) as e:
+            errors.append({"row": number, "error": str(e)})
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    if inserted:
+        get_spot_cache().spot_created(None)
+        get_feed_cache().clear()
+        bump_version(SPOTS_VERSION)
+    current_app.logger.info(f"bulk import: {inserted} spots inserted, {len(errors)} rows rejected")
+    return {"inserted": inserted, "errors": errors}
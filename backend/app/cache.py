@@ -0,0 +1,104 @@
+#in-process response cache for the spot listing and single spot reads
+#only the anonymous part of a response is cached, per-user fields such as
+#is_liked are added on top by the endpoint; entries expire after SPOT_CACHE_TTL
+#seconds and the write endpoints invalidate exactly the entries they affect
+import threading
+from cachetools import TTLCache
+from flask import current_app
+
+
+class SpotCache:
+    def __init__(self, maxsize, ttl):
+        self.enabled = ttl > 0 and maxsize > 0
+        self.listings = TTLCache(maxsize=max(maxsize, 1), ttl=max(ttl, 1))
+        self.spots = TTLCache(maxsize=max(maxsize, 1), ttl=max(ttl, 1))
+        self.lock = threading.Lock() #cachetools caches are not thread safe
+        self.generation = 0 #bumped by every invalidation, an entry built across one is not kept
+
+    @staticmethod
+    def listing_key(args):
+        return tuple(sorted(args.items(multi=True)))
+
+    def get_listing(self, key):
+        #returns (listing or None, generation); the generation goes back into set_listing
+        with self.lock:
+            entry = self.listings.get(key) if self.enabled else None
+            return (entry["listing"] if entry else None), self.generation
+
+    def set_listing(self, key, listing, generation, offset_paged=False, filtered=False):
+        #offset_paged: later pages shift when a spot disappears (geo and q modes)
+        #filtered: membership depends on spot content (q and tags filters)
+        if not self.enabled:
+            return
+        entry = {
+            "listing": listing,
+            "spot_ids": set(listing["spot_ids"]),
+            "offset_paged": offset_paged,
+            "filtered": filtered,
+        }
+        with self.lock:
+            #built from a read that raced a write, the next request rebuilds it
+            if self.generation == generation:
+                self.listings[key] = entry
+
+    def get_spot(self, spot_id):
+        #returns (spot data or None, generation) like get_listing
+        with self.lock:
+            return (self.spots.get(str(spot_id)) if self.enabled else None), self.generation
+
+    def set_spot(self, spot_id, spot_data, generation):
+        if not self.enabled:
+            return
+        with self.lock:
+            if self.generation == generation:
+                self.spots[str(spot_id)] = spot_data
+
+    def _drop(self, spot_id, should_drop):
+        #one lock for the spot and its listings, so nothing built before the write slips in between
+        with self.lock:
+            self.generation += 1
+            self.spots.pop(spot_id, None)
+            for key in [key for key, entry in self.listings.items() if should_drop(entry)]:
+                self.listings.pop(key, None)
+
+    def spot_created(self, spot_id):
+        #a new spot can show up on any listing page
+        with self.lock:
+            self.generation += 1
+            self.listings.clear()
+
+    def spot_updated(self, spot_id):
+        spot_id = str(spot_id)
+        self._drop(spot_id, lambda entry: spot_id in entry["spot_ids"] or entry["filtered"])
+
+    def spot_deleted(self, spot_id):
+        spot_id = str(spot_id)
+        self._drop(spot_id, lambda entry: spot_id in entry["spot_ids"] or entry["offset_paged"])
+
+    def spot_liked(self, spot_id):
+        #only like_count changed, so only entries showing this spot are stale
+        spot_id = str(spot_id)
+        self._drop(spot_id, lambda entry: spot_id in entry["spot_ids"])
+
+    def spot_commented(self, spot_id):
+        #only comment_count changed, same entries as a like
+        self.spot_liked(spot_id)
+
+    def users_changed(self):
+        #owner usernames are baked into every entry, a profile rename drops them all
+        with self.lock:
+            self.generation += 1
+            self.listings.clear()
+            self.spots.clear()
+
+
+def get_spot_cache():
+    #one cache per app, created on first use from SPOT_CACHE_TTL / SPOT_CACHE_MAXSIZE
+    cache = current_app.extensions.get('spot_cache')
+    if cache is None:
+        cache = SpotCache(
+            maxsize=current_app.config.get('SPOT_CACHE_MAXSIZE', 1024),
+            ttl=current_app.config.get('SPOT_CACHE_TTL', 30)
+        )
+        current_app.extensions['spot_cache'] = cache
+    return cache
@@ -0,0 +1,119 @@
+#cascade cleanup for deleted spots
+#delete_post only removes the spot and queues a task here, the comments and
+#likes that belonged to it are removed afterwards in bounded batches; tasks
+#live in mongo and every step is idempotent, so a worker that dies part way
+#leaves a task that the next worker (or `flask cleanup-deleted-spots`) resumes
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from .model import CleanupTask, Comment, Like
+from .cache import get_spot_cache
+
+
+def enqueue_spot_cleanup(spot_id):
+    CleanupTask._get_collection().update_one(
+        {"spot_id": spot_id},
+        {"$setOnInsert": {"created_at": datetime.utcnow(), "attempts": 0}},
+        upsert=True
+    )
+    if current_app.config.get('CLEANUP_IN_BACKGROUND', True):
+        _start_worker(current_app._get_current_object())
+
+
+def _worker_state(app):
+    return app.extensions.setdefault('cleanup_worker', {"lock": threading.Lock(), "thread": None, "wakeup": False})
+
+
+def _start_worker(app):
+    #at most one worker thread per app; wakeup tells a running worker to look again before it exits,
+    #so a task queued right after its last empty claim is not left behind
+    state = _worker_state(app)
+    with state["lock"]:
+        state["wakeup"] = True
+        if state["thread"] is not None and state["thread"].is_alive():
+            return
+        state["thread"] = threading.Thread(target=_worker, args=(app,), name='spot-cleanup', daemon=True)
+        state["thread"].start()
+
+
+def _worker(app):
+    state = _worker_state(app)
+    with app.app_context():
+        while True:
+            with state["lock"]:
+                state["wakeup"] = False
+            try:
+                run_pending_cleanups()
+            except Exception as e:
+                #the task keeps its lease and is retried once it runs out
+                app.logger.error(f"error cleaning up deleted spots: {str(e)}")
+            with state["lock"]:
+                if not state["wakeup"]:
+                    state["thread"] = None
+                    return
+
+
+def register_cleanup_sweep(app):
+    #the first request after a start works off tasks left pending or with an expired lease by a
+    #previous process; later requests only pay for the flag check
+    state = _worker_state(app)
+
+    @app.before_request
+    def sweep_pending_cleanups():
+        if state.get("swept"):
+            return
+        state["swept"] = True
+        if app.config.get('CLEANUP_IN_BACKGROUND', True):
+            _start_worker(app)
+
+
+def _claim_task():
+    #leases the oldest task nobody is working on
+    now = datetime.utcnow()
+    lease = timedelta(seconds=current_app.config.get('CLEANUP_LEASE_SECONDS', 300))
+    return CleanupTask._get_collection().find_one_and_update(
+        {"$or": [{"locked_until": None}, {"locked_until": {"$lt": now}}]},
+        {"$set": {"locked_until": now + lease}, "$inc": {"attempts": 1}},
+        sort=[("created_at", 1)]
+    )
+
+
+def _delete_in_batches(collection, query, batch_size, before_delete=None):
+    #deletes matching documents batch_size at a time so no single write holds the collection for long
+    total = 0
+    while True:
+        ids = [doc["_id"] for doc in collection.find(query, {"_id": 1}).limit(batch_size)]
+        if not ids:
+            return total
+        if before_delete:
+            before_delete(ids)
+        total += collection.delete_many({"_id": {"$in": ids}}).deleted_count
+
+
+def cleanup_spot(spot_id, batch_size=None):
+    #removes the spot's comments (and their likes) and the likes on the spot
+    batch_size = batch_size or current_app.config.get('CLEANUP_BATCH_SIZE', 500)
+    likes = Like._get_collection()
+
+    def delete_comment_likes(comment_ids):
+        #likes go first, if we stop in between the comments are still there to find them again
+        likes.delete_many({"target_type": "comment", "target_id": {"$in": comment_ids}})
+
+    comments = _delete_in_batches(Comment._get_collection(), {"parking_spot": spot_id}, batch_size,
+                                  before_delete=delete_comment_likes)
+    spot_likes = _delete_in_batches(likes, {"target_type": "spot", "target_id": spot_id}, batch_size)
+    #a listing read racing the delete may have cached the spot again
+    get_spot_cache().spot_deleted(spot_id)
+    return {"comments": comments, "likes": spot_likes}
+
+
+def run_pending_cleanups(batch_size=None):
+    #works off queued tasks until there are none left, returns how many were finished
+    finished = 0
+    while True:
+        task = _claim_task()
+        if task is None:
+            return finished
+        cleanup_spot(task["spot_id"], batch_size)
+        CleanupTask._get_collection().delete_one({"_id": task["_id"]})
+        finished += 1
@@ -0,0 +1,124 @@
+#grid clustering for the map view
+#every spot is counted into one cell per zoom level when it is created and
+#removed again when it is deleted, so reading clusters is a range scan on
+#(zoom, x, y) instead of a pass over all spots
+import math
+from flask import current_app
+from pymongo import UpdateOne, DeleteOne
+from .model import SpotCluster
+from .geo import search_spots
+from .utils import bulk_write
+
+SAMPLE_SIZE = 3
+
+
+def _max_zoom():
+    return current_app.config.get('CLUSTER_MAX_ZOOM', 16)
+
+
+def cell_size(zoom):
+    #degrees per cell, CLUSTER_CELLS_PER_TILE cells across a web map tile at this zoom
+    cells_per_tile = current_app.config.get('CLUSTER_CELLS_PER_TILE', 4)
+    return 360.0 / (2 ** zoom) / cells_per_tile
+
+
+def cell_for(lat, lng, zoom):
+    size = cell_size(zoom)
+    return int(math.floor((lng + 180) / size)), int(math.floor((lat + 90) / size))
+
+
+def clamp_zoom(zoom):
+    return max(0, min(zoom, _max_zoom()))
+
+
+def add_spot(spot):
+    add_spots([spot])
+
+
+def add_spots(spots):
+    #sums the spots per cell first, so a bulk import costs one update per touched cell,
+    #all of them sent in one bulk write
+    cells = {}
+    for spot in spots:
+        if spot.lat is None or spot.lng is None:
+            continue
+        for zoom in range(_max_zoom() + 1):
+            cell = cells.setdefault((zoom,) + cell_for(spot.lat, spot.lng, zoom),
+                                    {"count": 0, "sum_lat": 0.0, "sum_lng": 0.0, "ids": []})
+            cell["count"] += 1
+            cell["sum_lat"] += spot.lat
+            cell["sum_lng"] += spot.lng
+            cell["ids"].append(spot.id)
+    bulk_write(SpotCluster._get_collection(), [
+        UpdateOne(
+            {"zoom": zoom, "x": x, "y": y},
+            {
+                "$inc": {"count": cell["count"], "sum_lat": cell["sum_lat"], "sum_lng": cell["sum_lng"]},
+                #keep only the newest few ids as samples
+                "$push": {"sample_ids": {"$each": cell["ids"][-SAMPLE_SIZE:], "$slice": -SAMPLE_SIZE}},
+            },
+            upsert=True
+        )
+        for (zoom, x, y), cell in cells.items()
+    ], ordered=False)
+
+
+def remove_spot(spot):
+    #call after the spot is deleted, the sample refill must not find it again
+    if spot.lat is None or spot.lng is None:
+        return
+    collection = SpotCluster._get_collection()
+    cells = [
+        {"zoom": zoom, "x": x, "y": y}
+        for zoom, (x, y) in ((zoom, cell_for(spot.lat, spot.lng, zoom)) for zoom in range(_max_zoom() + 1))
+    ]
+    #ordered, so every empty cell is deleted after its decrement
+    bulk_write(collection, [
+        UpdateOne(cell, {
+            "$inc": {"count": -1, "sum_lat": -spot.lat, "sum_lng": -spot.lng},
+            "$pull": {"sample_ids": spot.id},
+        })
+        for cell in cells
+    ] + [DeleteOne(dict(cell, count={"$lte": 0})) for cell in cells])
+    _refill_samples(collection, cells)
+
+
+def _refill_samples(collection, cells):
+    #a pull can leave a cell with fewer samples than spots, top those up from parking_spots
+    short = [
+        cell for cell in collection.find({"$or": cells}, {"_id": 0, "zoom": 1, "x": 1, "y": 1, "count": 1, "sample_ids": 1})
+        if len(cell.get("sample_ids") or []) < min(cell["count"], SAMPLE_SIZE)
+    ]
+    requests = []
+    for cell in short:
+        size = cell_size(cell["zoom"])
+        min_lng, min_lat = cell["x"] * size - 180, cell["y"] * size - 90
+        bbox = (min_lng, min_lat, min_lng + size, min_lat + size)
+        spots = search_spots(((min_lat + bbox[3]) / 2, (min_lng + bbox[2]) / 2), bbox=bbox, limit=SAMPLE_SIZE, only=['id'])
+        requests.append(UpdateOne(
+            {"zoom": cell["zoom"], "x": cell["x"], "y": cell["y"]},
+            {"$set": {"sample_ids": [spot["_id"] for spot, _ in spots]}}
+        ))
+    bulk_write(collection, requests, ordered=False)
+
+
+def clusters_in_bbox(bbox, zoom):
+    min_lng, min_lat, max_lng, max_lat = bbox
+    min_x, min_y = cell_for(min_lat, min_lng, zoom)
+    max_x, max_y = cell_for(max_lat, max_lng, zoom)
+    cells = SpotCluster._get_collection().find(
+        {"zoom": zoom, "x": {"$gte": min_x, "$lte": max_x}, "y": {"$gte": min_y, "$lte": max_y}},
+        {"_id": 0, "count": 1, "sum_lat": 1, "sum_lng": 1, "sample_ids": 1}
+    )
+    clusters = []
+    for cell in cells:
+        count = cell["count"]
+        if count <= 0:
+            continue
+        clusters.append({
+            "count": count,
+            "lat": cell["sum_lat"] / count, #centroid of the spots in the cell
+            "lng": cell["sum_lng"] / count,
+            "sample_ids": [str(spot_id) for spot_id in cell.get("sample_ids", [])],
+        })
+    return clusters
@@ -0,0 +1,217 @@
+#maintenance commands, run with `flask --app run <command>`
+import click
+from datetime import datetime
+from flask import current_app
+from .model import ParkingSpot, SpotCluster, TagCount, Comment, Like, User, GeocodeCache
+from . import clusters
+from . import bulk
+from .cleanup import run_pending_cleanups
+from .trending import refresh_trending as refresh_trending_scores
+from .utils import using_mongomock
+
+
+@click.command('backfill-locations')
+@click.option('--batch-size', default=1000, show_default=True)
+def backfill_locations(batch_size):
+    #fills ParkingSpot.location for spots saved before the geojson field existed
+    collection = ParkingSpot._get_collection()
+    query = {"location": None, "lat": {"$ne": None}, "lng": {"$ne": None}}
+    total = 0
+    while True:
+        #each batch removes itself from the query, so the command can be stopped and rerun
+        batch = list(collection.find(query, {"lat": 1, "lng": 1}).limit(batch_size))
+        if not batch:
+            break
+        for doc in batch:
+            collection.update_one(
+                {"_id": doc["_id"]},
+                {"$set": {"location": {"type": "Point", "coordinates": [doc["lng"], doc["lat"]]}}}
+            )
+        total += len(batch)
+    click.echo(f"backfilled location on {total} spots")
+
+
+@click.command('rebuild-clusters')
+@click.option('--batch-size', default=1000, show_default=True)
+def rebuild_clusters(batch_size):
+    #recounts the map cluster index from scratch, e.g. after changing CLUSTER_MAX_ZOOM
+    SpotCluster.drop_collection()
+    SpotCluster.ensure_indexes()
+    total = 0
+    batch = []
+    for spot in ParkingSpot.objects(lat__ne=None, lng__ne=None).only('id', 'lat', 'lng').batch_size(batch_size):
+        batch.append(spot)
+        if len(batch) >= batch_size:
+            #one bulk write per batch instead of a write per spot and zoom level
+            clusters.add_spots(batch)
+            total += len(batch)
+            batch = []
+    clusters.add_spots(batch)
+    total += len(batch)
+    click.echo(f"clustered {total} spots")
+
+
+@click.command('rebuild-tag-counts')
+def rebuild_tag_counts():
+    #recomputes the tag facet counts with a single aggregation pass
+    counts = ParkingSpot.objects.aggregate([
+        {"$project": {"tags": {"$setUnion": [{"$ifNull": ["$tags", []]}, []]}}}, #dedupe per spot
+        {"$unwind": "$tags"},
+        {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
+    ])
+    TagCount.drop_collection()
+    TagCount.ensure_indexes()
+    total = 0
+    for row in counts:
+        TagCount(tag=row["_id"], count=row["count"]).save()
+        total += 1
+    click.echo(f"counted {total} tags")
+
+
+@click.command('migrate-likes')
+@click.option('--batch-size', default=500, show_default=True)
+def migrate_likes(batch_size):
+    #moves the embedded likes lists into the likes collection and resets like_count from it
+    #upserts make every step idempotent and each migrated document drops out of the query,
+    #so an interrupted run just picks up where it stopped
+    like_collection = Like._get_collection()
+    now = datetime.utcnow()
+    total = 0
+    for target_type, document in (('spot', ParkingSpot), ('comment', Comment)):
+        collection = document._get_collection()
+        while True:
+            batch = list(collection.find({"likes": {"$exists": True}}, {"likes": 1}).limit(batch_size))
+            if not batch:
+                break
+            for doc in batch:
+                target = {"target_type": target_type, "target_id": doc["_id"]}
+                for user_id in doc.get("likes") or []:
+                    like_collection.update_one(
+                        dict(target, user=user_id), {"$setOnInsert": {"created_at": now}}, upsert=True
+                    )
+                collection.update_one({"_id": doc["_id"]}, {
+                    "$set": {"like_count": like_collection.count_documents(target)},
+                    "$unset": {"likes": ""},
+                })
+            total += len(batch)
+    click.echo(f"migrated likes on {total} documents")
+
+
+@click.command('recount-comments')
+def recount_comments():
+    #recomputes ParkingSpot.comment_count and Comment.reply_count with one aggregation pass each,
+    #in case the $inc counts drifted
+    fixed = {}
+    for name, document, field, group_by in (
+        ('spots', ParkingSpot, 'comment_count', '$parking_spot'),
+        ('comments', Comment, 'reply_count', '$parent'),
+    ):
+        counts = {
+            row["_id"]: row["count"]
+            for row in Comment.objects.aggregate([{"$group": {"_id": group_by, "count": {"$sum": 1}}}])
+        }
+        collection = document._get_collection()
+        fixed[name] = 0
+        #only documents whose stored count is off are written
+        for doc in collection.find({}, {field: 1}):
+            count = counts.get(doc["_id"], 0)
+            if doc.get(field, 0) != count:
+                collection.update_one({"_id": doc["_id"]}, {"$set": {field: count}})
+                fixed[name] += 1
+    click.echo(f"recounted comments, fixed {fixed['spots']} spots and {fixed['comments']} comments")
+
+
+@click.command('rebuild-comment-previews')
+def rebuild_comment_previews():
+    #refills ParkingSpot.comment_preview from the comments with one aggregation pass,
+    #e.g. for spots commented on before the preview existed or after changing COMMENT_PREVIEW_SIZE
+    size = current_app.config.get('COMMENT_PREVIEW_SIZE', 3)
+    entry = {"_id": "$_id", "text": "$text", "author": "$author", "created_at": "$created_at"}
+    pipeline = [{"$match": {"parent": None}}, {"$sort": {"created_at": -1, "_id": -1}}]
+    if using_mongomock():
+        #no $firstN there, the whole list is built and cut afterwards
+        pipeline += [
+            {"$group": {"_id": "$parking_spot", "comments": {"$push": entry}}},
+            {"$project": {"comments": {"$slice": ["$comments", size]}}},
+        ]
+    else:
+        #$firstN keeps at most size comments per spot while grouping, however busy the spot
+        pipeline.append({"$group": {"_id": "$parking_spot", "comments": {"$firstN": {"input": entry, "n": size}}}})
+    previews = {row["_id"]: row["comments"] for row in Comment.objects.aggregate(pipeline)}
+
+    collection = ParkingSpot._get_collection()
+    fixed = 0
+    #only spots whose stored preview is off are written
+    for doc in collection.find({}, {"comment_preview": 1}):
+        preview = previews.get(doc["_id"], [])
+        if doc.get("comment_preview", []) != preview:
+            collection.update_one({"_id": doc["_id"]}, {"$set": {"comment_preview": preview}})
+            fixed += 1
+    click.echo(f"rebuilt comment previews, fixed {fixed} spots")
+
+
+@click.command('import-spots')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--owner', required=True, help='username or email of the user the spots belong to')
+@click.option('--format', 'fmt', type=click.Choice(bulk.FORMATS), help='defaults to the file extension')
+@click.option('--batch-size', default=1000, show_default=True)
+def import_spots(path, owner, fmt, batch_size):
+    #loads a csv or geojson parking inventory, same validation as POST /api/parking/spots/bulk
+    user = User.objects(username=owner).first() or User.objects(email=owner).first()
+    if not user:
+        raise click.ClickException(f"no user {owner}")
+    if fmt is None:
+        fmt = 'csv' if path.lower().endswith('.csv') else 'geojson'
+    with open(path, encoding='utf-8-sig') as f:
+        try:
+            rows = bulk.parse_rows(f.read(), fmt)
+        except ValueError as e:
+            raise click.ClickException(f"cannot read {path}: {e}")
+
+    report = bulk.import_spots(rows, user, batch_size=batch_size)
+    for error in report["errors"]:
+        click.echo(f"row {error['row']}: {error['error']}", err=True)
+    click.echo(f"imported {report['inserted']} spots, rejected {len(report['errors'])} rows")
+
+
+@click.command('geocode-stats')
+def geocode_stats():
+    #what the persistent geocode cache saved, the in-process counts are logged by the geocoder itself
+    rows = GeocodeCache.objects.aggregate([
+        {"$group": {"_id": "$provider", "addresses": {"$sum": 1}, "hits": {"$sum": "$hits"}}},
+        {"$sort": {"_id": 1}},
+    ])
+    total_addresses = total_hits = 0
+    for row in rows:
+        click.echo(f"{row['_id']}: {row['addresses']} addresses, {row['hits']} cache hits")
+        total_addresses += row["addresses"]
+        total_hits += row["hits"]
+    click.echo(f"{total_addresses} cached addresses saved {total_hits} provider lookups")
+
+
+@click.command('cleanup-deleted-spots')
+@click.option('--batch-size', default=500, show_default=True)
+def cleanup_deleted_spots(batch_size):
+    #finishes cleanups queued by delete_post, e.g. after the server died while running them
+    finished = run_pending_cleanups(batch_size)
+    click.echo(f"cleaned up {finished} deleted spots")
+
+
+@click.command('refresh-trending')
+def refresh_trending():
+    #recomputes the trending scores from the raw likes and comments, run it periodically (e.g. hourly cron)
+    total = refresh_trending_scores()
+    click.echo(f"refreshed trending scores, {total} spots with recent activity")
+
+
+def register_commands(app):
+    app.cli.add_command(backfill_locations)
+    app.cli.add_command(rebuild_clusters)
+    app.cli.add_command(rebuild_tag_counts)
+    app.cli.add_command(migrate_likes)
+    app.cli.add_command(recount_comments)
+    app.cli.add_command(rebuild_comment_previews)
+    app.cli.add_command(import_spots)
+    app.cli.add_command(geocode_stats)
+    app.cli.add_command(cleanup_deleted_spots)
+    app.cli.add_command(refresh_trending)
@@ -1,22 +1,122 @@
+from bson import ObjectId
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from .model import Comment, ParkingSpot, User
+from .model import Comment, ParkingSpot, User, Like
+from .likes import toggle_like, liked_ids, like_count_deltas, likes_buffered, like_buffer_marker
+from .fields import parse_fields, projection_for
+from .pagination import parse_limit, page_by_created_at, encode_cursor, decode_cursor, InvalidCursor
+from .cache import get_spot_cache
+from .utils import parse_object_id, existing_id
+from . import trending
+from .versions import (
+    SPOTS_VERSION, USERS_VERSION, comments_version, bump_version, get_versions, make_etag, not_modified, set_validators
+)
 from datetime import datetime
 
 
 comment_bp = Blueprint('comment', __name__, url_prefix='/api/comments')
 
+#response field -> Comment fields it is built from, for ?fields=
+COMMENT_FIELDS = {
+    "id": ("id",),
+    "text": ("text",),
+    "author": ("author",),
+    "created_at": ("created_at",),
+    "like_count": ("like_count",),
+    "reply_count": ("reply_count",),
+    "is_liked": (),
+}
+
+def _comments_to_dicts(comments, fields, current_user_id):
+    #comments are raw as_pymongo() dicts, authors, likes and buffered like counts are read once for all of them
+    author_names = {}
+    if "author" in fields:
+        #every author on the page with one query
+        author_ids = {comment['author'] for comment in comments if comment.get('author')}
+        author_names = {user.id: user.username for user in User.objects(id__in=author_ids).only('username')}
+
+    liked = set()
+    if "is_liked" in fields and current_user_id:
+        current_user = User.objects(id=current_user_id).first()
+        liked = liked_ids(current_user, 'comment', [comment['_id'] for comment in comments])
+    
+    like_deltas = like_count_deltas('comment', [comment['_id'] for comment in comments]) if "like_count" in fields else {}
+    
+    comments_data = []
+    for comment in comments:
+        values = {
+            "id": lambda: str(comment['_id']),
+            "text": lambda: comment.get('text'),
+            "author": lambda: author_names.get(comment.get('author'), "Unknown"),
+            "created_at": lambda: comment['created_at'].isoformat(),
+            "like_count": lambda: comment.get('like_count', 0) + like_deltas.get(comment['_id'], 0),
+            "reply_count": lambda: comment.get('reply_count', 0),
+            "is_liked": lambda: comment['_id'] in liked,
+        }
+        comments_data.append({field: value() for field, value in values.items() if field in fields})
+    return comments_data
+
+
+def _thread(root, rows, comments_data, limit, truncated):
+    #nests a subtree read in path order under root, at most limit replies per comment;
+    #a comment with more replies than shown gets next_after, the cursor for its next page of replies
+    #(None with no replies shown means the subtree read was cut off, ask again without a cursor)
+    nodes = {root['_id']: {"replies": []}}
+    last_paths = {}
+    seen = {}
+    for row, data in zip(rows, comments_data):
+        parent_id = row.get('parent')
+        parent = nodes.get(parent_id)
+        #the parent comes first in path order, so a missing parent means it was not shown
+        if parent is None:
+            continue
+        seen[parent_id] = seen.get(parent_id, 0) + 1
+        if len(parent["replies"]) >= limit:
+            continue
+        node = dict(data, replies=[])
+        parent["replies"].append(node)
+        nodes[row['_id']] = node
+        last_paths[parent_id] = row['path']
+    for row in [root] + rows:
+        node = nodes.get(row['_id'])
+        if node is None:
+            continue
+        if row is root:
+            #the first level may start at an ?after= cursor, so reply_count says nothing here
+            more = seen.get(root['_id'], 0) > len(node["replies"]) or truncated
+        else:
+            more = row.get('reply_count', 0) > len(node["replies"])
+        last_path = last_paths.get(row['_id'])
+        node["next_after"] = encode_cursor({"p": last_path}) if more and last_path else None
+    return nodes[root['_id']]
+
+
+def _preview_entry(comment):
+    #what ParkingSpot.comment_preview keeps of a comment, the author name is looked up when listing
+    return {"_id": comment["_id"], "text": comment.get("text"), "author": comment.get("author"), "created_at": comment["created_at"]}
+
+
+def _latest_preview(parking_spot_id):
+    #the preview rebuilt from the (parking_spot, parent, created_at, id) index, one query
+    size = current_app.config.get('COMMENT_PREVIEW_SIZE', 3)
+    comments = Comment.objects(parking_spot=parking_spot_id, parent=None).only('id', 'text', 'author', 'created_at')
+    return [_preview_entry(comment) for comment in comments.order_by('-created_at', '-id').limit(size).as_pymongo()]
+
+
 @comment_bp.route('/<parking_spot_id>', methods=['POST'])
 @jwt_required()
 def create_comment(parking_spot_id):
     try:
         current_user_id = get_jwt_identity()
-        user = User.objects(id=current_user_id).first()
-        parking_spot = ParkingSpot.objects(id=parking_spot_id).first()
+        user = User.objects(id=current_user_id).only('id', 'username').first()
+        try:
+            parking_spot_id = existing_id(ParkingSpot, parking_spot_id) #the comment only needs the reference
+        except ValueError:
+            return jsonify({"error": "Invalid parking spot id"}), 400
         
         if not user:
             return jsonify({"error": "User not found"}), 404
-        if not parking_spot:
+        if not parking_spot_id:
             return jsonify({"error": "Parking spot not found"}), 404
         
         data = request.get_json()
@@ -24,13 +124,43 @@ def create_comment(parking_spot_id):
         if 'text' not in data or not data['text'].strip():
             return jsonify({"error": "Comment text is required"}), 400
         
+        parent = None
+        if data.get('parent_id'): #a reply
+            try:
+                parent_id = parse_object_id(data['parent_id'])
+            except ValueError:
+                return jsonify({"error": "Invalid parent id"}), 400
+            parent = Comment.objects(id=parent_id, parking_spot=parking_spot_id).only('id', 'ancestors', 'path').first()
+            if not parent:
+                return jsonify({"error": "Parent comment not found"}), 404
+        
+        #the id is picked before saving because it is part of the path
+        comment_id = ObjectId()
         comment = Comment(
+            id=comment_id,
             text=data['text'],
             author=user,
-            parking_spot=parking_spot
+            parking_spot=parking_spot_id,
+            parent=parent,
+            ancestors=(parent.ancestors + [parent.id]) if parent else [],
+            path=f"{parent.path or parent.id}/{comment_id}" if parent else str(comment_id)
         )
         
-        comment.save()
+        comment.save(force_insert=True)
+        spot_update = {"$inc": {"comment_count": 1}}
+        if not parent:
+            #newest first and capped, in the same write as the count; sorting rather than
+            #prepending keeps the order right when two comments are saved at once
+            spot_update["$push"] = {"comment_preview": {
+                "$each": [_preview_entry(comment.to_mongo())], "$sort": {"created_at": -1, "_id": -1},
+                "$slice": current_app.config.get('COMMENT_PREVIEW_SIZE', 3)
+            }}
+        ParkingSpot._get_collection().update_one({"_id": parking_spot_id}, spot_update)
+        if parent:
+            Comment.objects(id=parent.id).update_one(inc__reply_count=1)
+        trending.record_comment(parking_spot_id, comment.created_at)
+        get_spot_cache().spot_commented(parking_spot_id)
+        bump_version(SPOTS_VERSION, comments_version(parking_spot_id))
         
         return jsonify({
             "message": "Comment created successfully",
@@ -38,7 +168,8 @@ def create_comment(parking_spot_id):
                 "id": str(comment.id),
                 "text": comment.text,
                 "author": user.username,
-                "created_at": comment.created_at.isoformat()
+                "created_at": comment.created_at.isoformat(),
+                "parent_id": str(parent.id) if parent else None
             }
         }), 201
         
@@ -51,37 +182,103 @@ def create_comment(parking_spot_id):
 def get_comments(parking_spot_id):
     try:
         current_user_id = get_jwt_identity()
-        current_user = None
-        if current_user_id:
-            current_user = User.objects(id=current_user_id).first()
+        try:
+            fields = parse_fields(request.args.get('fields'), COMMENT_FIELDS)
+        except ValueError:
+            return jsonify({"error": "Invalid fields"}), 400
+        try:
+            limit = parse_limit(request.args.get('limit'), default_key='COMMENTS_PAGE_SIZE')
+        except ValueError:
+            return jsonify({"error": "Invalid limit"}), 400
+        before = request.args.get('before') #next_before of the previous page
+        try:
+            parking_spot_id = parse_object_id(parking_spot_id)
+        except ValueError:
+            return jsonify({"error": "Invalid id"}), 400
+
+        versions, last_modified = get_versions(comments_version(parking_spot_id), USERS_VERSION)
+        etag = make_etag(versions, parking_spot_id, current_user_id, sorted(fields), limit, before, like_buffer_marker())
+        unchanged = not_modified(etag, last_modified)
+        if unchanged:
+            return unchanged
 
-        parking_spot = ParkingSpot.objects(id=parking_spot_id).first()
+        parking_spot = ParkingSpot.objects(id=parking_spot_id).only('id').first()
         if not parking_spot:
             return jsonify({"error": "Parking spot not found"}), 404
         
-        comments = Comment.objects(parking_spot=parking_spot).order_by('-created_at')
-        
-        comments_data = []
-        for comment in comments:
-            is_liked = False
-            if current_user and comment.likes:
-                is_liked = current_user in comment.likes
+        #top-level comments newest first, keyset on the (parking_spot, parent, created_at, id) index so every page costs the same
+        only = projection_for(fields, COMMENT_FIELDS, always=('id', 'created_at'))
+        try:
+            comments, next_before = page_by_created_at(
+                Comment.objects(parking_spot=parking_spot, parent=None).only(*only).as_pymongo(), before, limit
+            )
+        except InvalidCursor:
+            return jsonify({"error": "Invalid cursor"}), 400
 
-            comments_data.append({
-                "id": str(comment.id),
-                "text": comment.text,
-                "author": comment.author.username,
-                "created_at": comment.created_at.isoformat(),
-                "like_count": len(comment.likes) if comment.likes else 0,
-                "is_liked": is_liked
-            })
-        
-        return jsonify({"comments": comments_data}), 200
+        comments_data = _comments_to_dicts(comments, fields, current_user_id)
+        response = jsonify({"comments": comments_data, "next_before": next_before})
+        return set_validators(response, etag, last_modified), 200
         
     except Exception as e:
         current_app.logger.error(f"Error fetching comments: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+@comment_bp.route('/<parking_spot_id>/<comment_id>/replies', methods=['GET'])
+@jwt_required(optional=True)
+def get_replies(parking_spot_id, comment_id):
+    #the replies under a comment, nested, with one query for the whole subtree
+    #?limit= replies are shown per level, ?after= is a next_after cursor and pages the first level
+    try:
+        current_user_id = get_jwt_identity()
+        try:
+            fields = parse_fields(request.args.get('fields'), COMMENT_FIELDS)
+        except ValueError:
+            return jsonify({"error": "Invalid fields"}), 400
+        try:
+            limit = parse_limit(request.args.get('limit'), default_key='COMMENT_REPLIES_PAGE_SIZE')
+        except ValueError:
+            return jsonify({"error": "Invalid limit"}), 400
+        after = request.args.get('after')
+        try:
+            parking_spot_id, comment_id = parse_object_id(parking_spot_id), parse_object_id(comment_id)
+        except ValueError:
+            return jsonify({"error": "Invalid id"}), 400
+
+        versions, last_modified = get_versions(comments_version(parking_spot_id), USERS_VERSION)
+        etag = make_etag(versions, parking_spot_id, comment_id, current_user_id, sorted(fields), limit, after,
+                         like_buffer_marker())
+        unchanged = not_modified(etag, last_modified)
+        if unchanged:
+            return unchanged
+
+        root = Comment.objects(id=comment_id, parking_spot=parking_spot_id).only('id', 'path', 'reply_count').as_pymongo().first()
+        if not root:
+            return jsonify({"error": "Comment not found"}), 404
+        root_path = root.get('path') or str(root['_id'])
+
+        query = {"ancestors": root['_id']}
+        if after:
+            try:
+                after_path = decode_cursor(after).get('p')
+            except InvalidCursor:
+                return jsonify({"error": "Invalid cursor"}), 400
+            if not isinstance(after_path, str) or not after_path.startswith(root_path + '/'):
+                return jsonify({"error": "Invalid cursor"}), 400
+            #'~' sorts after the hex ids and '/', so this also skips the subtree of the cursor comment
+            query["path"] = {"$gt": after_path + '~'}
+
+        only = projection_for(fields, COMMENT_FIELDS, always=('id', 'parent', 'path', 'reply_count'))
+        thread_max = current_app.config.get('COMMENT_THREAD_MAX', 500)
+        rows = list(Comment.objects(__raw__=query).only(*only).order_by('path').limit(thread_max).as_pymongo())
+        thread = _thread(root, rows, _comments_to_dicts(rows, fields, current_user_id), limit, len(rows) >= thread_max)
+
+        response = jsonify(thread)
+        return set_validators(response, etag, last_modified), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Error fetching replies: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
 @comment_bp.route('/<parking_spot_id>/<comment_id>', methods=['POST'])
 @jwt_required()
 def like_comment(parking_spot_id, comment_id):
@@ -92,26 +289,76 @@ def like_comment(parking_spot_id, comment_id):
         
         if not user:
             return jsonify({"error": "User not found"}), 404
+        try:
+            #a comment of this spot, checked without loading it; toggle_like never writes for a missing one
+            comment_id = existing_id(Comment, comment_id, parking_spot=parse_object_id(parking_spot_id))
+        except ValueError:
+            return jsonify({"error": "Invalid id"}), 400
+        if not comment_id:
+            return jsonify({"error": "Comment not found"}), 404
             
-        comment = Comment.objects(id=comment_id).first()
+        result = toggle_like('comment', comment_id, user)
         
-        if not comment:
+        if result is None:
             return jsonify({"error": "Comment not found"}), 404
-            
-        if user in comment.likes:
-            comment.likes.remove(user)
-            liked = False
-        else:
-            comment.likes.append(user)
-            liked = True
-            
-        comment.save()
+        liked, like_count = result
+        if not likes_buffered():
+            bump_version(comments_version(parking_spot_id))
         
         return jsonify({
-            "like_count": len(comment.likes),
+            "like_count": like_count,
             "is_liked": liked
         }), 200
         
     except Exception as e:
         current_app.logger.error(f"Error liking comment: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
+
+@comment_bp.route('/<parking_spot_id>/<comment_id>', methods=['DELETE'])
+@jwt_required()
+def delete_comment(parking_spot_id, comment_id):
+    try:
+        current_user_id = get_jwt_identity()
+        user = User.objects(id=current_user_id).first()
+        
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+        try:
+            comment_id = parse_object_id(comment_id)
+            parking_spot_id = parse_object_id(parking_spot_id)
+        except ValueError:
+            return jsonify({"error": "Invalid id"}), 400
+        
+        #delete and membership test in one step, so two concurrent deletes only decrement once
+        removed = Comment._get_collection().find_one_and_delete(
+            {"_id": comment_id, "parking_spot": parking_spot_id, "author": user.id},
+            projection={"created_at": 1, "parent": 1}
+        )
+        if not removed: #comment does not exist or user is not the author
+            return jsonify({"error": "Comment not found or unauthorized"}), 404
+        
+        #its replies go with it, found through the ancestors index
+        collection = Comment._get_collection()
+        replies = list(collection.find({"ancestors": removed["_id"]}, {"created_at": 1}))
+        if replies:
+            collection.delete_many({"_id": {"$in": [reply["_id"] for reply in replies]}})
+        removed_ids = [removed["_id"]] + [reply["_id"] for reply in replies]
+        
+        spot_update = {"$inc": {"comment_count": -len(removed_ids)}}
+        if not removed.get("parent"):
+            #an older comment moves up into the preview
+            spot_update["$set"] = {"comment_preview": _latest_preview(parking_spot_id)}
+        ParkingSpot._get_collection().update_one({"_id": parking_spot_id}, spot_update)
+        if removed.get("parent"):
+            Comment.objects(id=removed["parent"]).update_one(dec__reply_count=1)
+        Like.objects(target_type='comment', target_id__in=removed_ids).delete()
+        for comment in [removed] + replies:
+            trending.record_uncomment(parking_spot_id, comment.get("created_at"))
+        get_spot_cache().spot_commented(parking_spot_id)
+        bump_version(SPOTS_VERSION, comments_version(parking_spot_id))
+        
+        return jsonify({"message": "Comment deleted"}), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Error deleting comment: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
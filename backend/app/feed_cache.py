@@ -0,0 +1,139 @@
+#feed cache for "spots near me" (near= listings without bbox, q or tags)
+#for every active geohash cell it keeps the spots around the cell center sorted
+#by distance, as (id, lat, lng) only, so a near= query from anywhere in the cell
+#is answered by re-sorting that short list; only spot creates and deletes change
+#it, and they drop just the cells whose area covers the spot
+import threading
+from cachetools import TTLCache
+from flask import current_app
+from .geo import distance_in_meters, search_spots
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(lat, lng, precision):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        value, value_range = (lng, lng_range) if even else (lat, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def geohash_bounds(cell):
+    #(min_lat, min_lng, max_lat, max_lng) of a geohash cell
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in cell:
+        index = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lng_range if even else lat_range
+            mid = (value_range[0] + value_range[1]) / 2
+            if index >> shift & 1:
+                value_range[0] = mid
+            else:
+                value_range[1] = mid
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+class FeedCache:
+    def __init__(self, maxsize, ttl, precision, max_radius_m, max_spots):
+        self.enabled = ttl > 0 and maxsize > 0
+        self.cells = TTLCache(maxsize=max(maxsize, 1), ttl=max(ttl, 1))
+        self.precision = precision
+        self.max_radius_m = max_radius_m
+        self.max_spots = max_spots
+        self.lock = threading.Lock() #cachetools caches are not thread safe
+        self.generation = 0 #bumped by every invalidation, a cell built across one is not kept
+
+    def _build(self, cell):
+        #every spot that a query from inside the cell with radius up to max_radius_m can return
+        min_lat, min_lng, max_lat, max_lng = geohash_bounds(cell)
+        center = ((min_lat + max_lat) / 2, (min_lng + max_lng) / 2)
+        half_diagonal = distance_in_meters(center[0], center[1], max_lat, max_lng)
+        coverage = self.max_radius_m + half_diagonal
+        rows = search_spots(center, radius_m=coverage, limit=self.max_spots + 1, only=['id', 'lat', 'lng'])
+        if len(rows) > self.max_spots:
+            #too dense to keep everything, only queries that stay inside what we kept are served
+            rows = rows[:self.max_spots]
+            coverage = rows[-1][1]
+        return {
+            "center": center,
+            "coverage": coverage,
+            "spots": [(raw['_id'], raw['lat'], raw['lng']) for raw, _ in rows],
+        }
+
+    def search(self, center, radius_m, skip, limit):
+        #returns [(spot_id, distance_m)] like geo.search_spots, or None when the cache cannot answer
+        if not self.enabled or radius_m is None or radius_m > self.max_radius_m:
+            return None
+        cell = geohash_encode(center[0], center[1], self.precision)
+        with self.lock:
+            entry = self.cells.get(cell)
+            generation = self.generation
+        if entry is None:
+            #built without the lock, so a spot created meanwhile may be missing from it
+            entry = self._build(cell)
+            with self.lock:
+                if self.generation != generation:
+                    return None
+                self.cells[cell] = entry
+        lat, lng = center
+        if radius_m + distance_in_meters(lat, lng, *entry["center"]) > entry["coverage"]:
+            return None
+        results = []
+        for spot_id, spot_lat, spot_lng in entry["spots"]:
+            distance = distance_in_meters(lat, lng, spot_lat, spot_lng)
+            if distance <= radius_m:
+                results.append((spot_id, distance))
+        results.sort(key=lambda item: (item[1], str(item[0])))
+        return results[skip:skip + limit]
+
+    def _drop_cells_covering(self, lat, lng):
+        with self.lock:
+            self.generation += 1
+            for cell in [cell for cell, entry in self.cells.items()
+                         if distance_in_meters(lat, lng, *entry["center"]) <= entry["coverage"]]:
+                self.cells.pop(cell, None)
+
+    def spot_created(self, lat, lng):
+        if lat is not None and lng is not None:
+            self._drop_cells_covering(lat, lng)
+
+    def spot_deleted(self, lat, lng):
+        self.spot_created(lat, lng)
+
+    def clear(self):
+        #bulk imports touch too many places to check cell by cell
+        with self.lock:
+            self.generation += 1
+            self.cells.clear()
+
+
+def get_feed_cache():
+    #one cache per app, created on first use from the FEED_* settings
+    cache = current_app.extensions.get('feed_cache')
+    if cache is None:
+        config = current_app.config
+        cache = FeedCache(
+            maxsize=config.get('FEED_CACHE_CELLS', 256),
+            ttl=config.get('FEED_CACHE_TTL', 300),
+            precision=config.get('FEED_CELL_PRECISION', 6),
+            max_radius_m=config.get('FEED_MAX_RADIUS_M', 5000),
+            max_spots=config.get('FEED_MAX_SPOTS', 5000)
+        )
+        current_app.extensions['feed_cache'] = cache
+    return cache
@@ -0,0 +1,23 @@
+#sparse fieldsets (?fields=id,lat,lng,title) for the list endpoints
+#each endpoint maps its response fields to the document fields they are built
+#from, so only those are read from mongo and rows stay raw dicts (as_pymongo)
+
+
+def parse_fields(raw_fields, allowed):
+    #returns the requested response fields, or every allowed field when none are given
+    #unknown names raise ValueError, the endpoints answer that with a 400
+    if not raw_fields:
+        return set(allowed)
+    fields = {field for field in (part.strip() for part in raw_fields.split(',')) if field}
+    unknown = fields - set(allowed)
+    if unknown or not fields:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def projection_for(fields, allowed, always=()):
+    #document fields to pass to .only() for the requested response fields
+    projection = set(always)
+    for field in fields:
+        projection.update(allowed[field])
+    return sorted(projection)
@@ -0,0 +1,120 @@
+#geospatial helpers for the parking spot listing (near= and bbox= query modes)
+import math
+from flask import current_app
+from .model import ParkingSpot
+from .utils import using_mongomock
+
+EARTH_RADIUS_M = 6371e3
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+def parse_near(raw):
+    #near=lat,lng
+    lat, lng = (float(part) for part in raw.split(','))
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("near is out of range")
+    return lat, lng
+
+
+def parse_bbox(raw):
+    #bbox=min_lng,min_lat,max_lng,max_lat (same order as geojson)
+    min_lng, min_lat, max_lng, max_lat = (float(part) for part in raw.split(','))
+    if not (-180 <= min_lng < max_lng <= 180 and -90 <= min_lat < max_lat <= 90):
+        raise ValueError("bbox is out of range")
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def parse_radius(raw):
+    default = current_app.config.get('GEO_DEFAULT_RADIUS_M', 5000)
+    maximum = current_app.config.get('GEO_MAX_RADIUS_M', 50000)
+    if raw is None or raw == '':
+        return default
+    radius = float(raw)
+    if radius <= 0:
+        raise ValueError("radius_m must be positive")
+    return min(radius, maximum)
+
+
+def bbox_center(bbox):
+    min_lng, min_lat, max_lng, max_lat = bbox
+    return (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+
+
+def bbox_polygon(bbox):
+    min_lng, min_lat, max_lng, max_lat = bbox
+    return {
+        "type": "Polygon",
+        "coordinates": [[
+            [min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat],
+            [min_lng, max_lat], [min_lng, min_lat]
+        ]]
+    }
+
+
+def distance_in_meters(lat1, lng1, lat2, lng2):
+    #haversine, same formula the frontend used in geo.ts
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return EARTH_RADIUS_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def search_spots(center, radius_m=None, bbox=None, skip=0, limit=50, extra_query=None, only=None):
+    #returns [(raw spot dict, distance_m)] sorted by distance from center
+    #extra_query is a raw filter applied on top, e.g. from tags=
+    #only limits the spot fields that are read, everything but the legacy likes by default
+    #uses $geoNear on the 2dsphere index, falls back to a lat/lng scan on mongomock
+    lat, lng = center
+    geo_near = {
+        "near": {"type": "Point", "coordinates": [lng, lat]},
+        "distanceField": "distance_m",
+        "spherical": True,
+        "key": "location",
+    }
+    if radius_m is not None:
+        geo_near["maxDistance"] = radius_m
+    geo_near["query"] = dict(extra_query or {})
+    if bbox is not None:
+        geo_near["query"]["location"] = {"$geoWithin": {"$geometry": bbox_polygon(bbox)}}
+    if only:
+        projection = {ParkingSpot._fields[name].db_field: 1 for name in only}
+        projection["distance_m"] = 1
+    else:
+        projection = {"likes": 0}
+    pipeline = [{"$geoNear": geo_near}, {"$skip": skip}, {"$limit": limit}, {"$project": projection}]
+
+    if using_mongomock():
+        return _search_spots_fallback(center, radius_m, bbox, skip, limit, extra_query, only)
+
+    results = []
+    for raw in ParkingSpot._get_collection().aggregate(pipeline):
+        distance = raw.pop("distance_m")
+        results.append((raw, distance))
+    return results
+
+
+def _search_spots_fallback(center, radius_m, bbox, skip, limit, extra_query, only):
+    #mongomock has no geo operators, so prefilter on a lat/lng box and sort in python
+    lat, lng = center
+    if bbox is not None:
+        min_lng, min_lat, max_lng, max_lat = bbox
+    else:
+        d_lat = radius_m / METERS_PER_DEGREE_LAT
+        d_lng = radius_m / (METERS_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        min_lat, max_lat = lat - d_lat, lat + d_lat
+        min_lng, max_lng = lng - d_lng, lng + d_lng
+
+    candidates = ParkingSpot.objects(
+        lat__gte=min_lat, lat__lte=max_lat, lng__gte=min_lng, lng__lte=max_lng,
+        __raw__=extra_query or {}
+    )
+    candidates = candidates.only(*only, 'lat', 'lng') if only else candidates.exclude('likes')
+    results = []
+    for raw in candidates.as_pymongo():
+        distance = distance_in_meters(lat, lng, raw['lat'], raw['lng'])
+        if radius_m is None or distance <= radius_m:
+            results.append((raw, distance))
+    results.sort(key=lambda item: item[1])
+    return results[skip:skip + limit]
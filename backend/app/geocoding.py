@@ -0,0 +1,134 @@
+#server side geocoding for spots created with an address but no coordinates
+#lookups go through an in-process lru, then the geocode_cache collection and
+#only then the configured provider, so a repeated address never leaves the process
+import hashlib
+import re
+import threading
+from datetime import datetime
+import requests
+from cachetools import LRUCache
+from flask import current_app
+from .model import GeocodeCache
+
+
+class GeocodingError(Exception):
+    #the provider could not be reached or answered with an error
+    pass
+
+
+def normalize_address(address):
+    #"123  Main St., Riverside" and "123 main st riverside" share a cache entry
+    return ' '.join(re.sub(r"[^\w\s]", ' ', (address or '').lower()).split())
+
+
+class NominatimProvider:
+    name = 'nominatim'
+
+    def __init__(self, config):
+        self.url = config.get('GEOCODER_URL', 'https://nominatim.openstreetmap.org/search')
+        self.user_agent = config.get('GEOCODER_USER_AGENT', 'ParkingApp/1.0')
+        self.timeout = config.get('GEOCODER_TIMEOUT', 5)
+
+    def geocode(self, address):
+        #returns (lat, lng) or None when the address is unknown
+        try:
+            response = requests.get(
+                self.url,
+                params={"format": "json", "limit": 1, "q": address},
+                headers={"User-Agent": self.user_agent},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            results = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise GeocodingError(str(e))
+        if not results:
+            return None
+        return float(results[0]["lat"]), float(results[0]["lon"])
+
+
+class StubProvider:
+    #no network: GEOCODER_STUB_RESULTS maps normalized addresses to (lat, lng) or None,
+    #anything else gets made up but stable coordinates
+    name = 'stub'
+
+    def __init__(self, config):
+        self.results = config.get('GEOCODER_STUB_RESULTS', {})
+        self.calls = 0
+
+    def geocode(self, address):
+        self.calls += 1
+        key = normalize_address(address)
+        if key in self.results:
+            return self.results[key]
+        digest = int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16)
+        return (digest % 18000) / 100.0 - 90, (digest // 18000 % 36000) / 100.0 - 180
+
+
+PROVIDERS = {'nominatim': NominatimProvider, 'stub': StubProvider}
+
+
+class Geocoder:
+    def __init__(self, provider, memory_size):
+        self.provider = provider
+        self.memory = LRUCache(maxsize=max(memory_size, 1))
+        self.lock = threading.Lock() #cachetools caches are not thread safe
+        self.stats = {"memory_hits": 0, "cache_hits": 0, "misses": 0, "not_found": 0}
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def geocode(self, address):
+        #returns (lat, lng) or None, raises GeocodingError when the provider fails
+        key = normalize_address(address)
+        if not key:
+            return None
+
+        with self.lock:
+            coordinates = self.memory.get(key)
+        if coordinates is not None:
+            self._count("memory_hits")
+            return coordinates
+
+        #the hit counter doubles as the read, one round trip for a cached address
+        cached = GeocodeCache._get_collection().find_one_and_update(
+            {"_id": key}, {"$inc": {"hits": 1}}, projection={"lat": 1, "lng": 1}
+        )
+        if cached is not None:
+            self._count("cache_hits")
+            coordinates = (cached["lat"], cached["lng"])
+        else:
+            self._count("misses")
+            coordinates = self.provider.geocode(address)
+            #only misses reach the provider, so this logs the hit/miss counts once per real lookup
+            current_app.logger.info(f"geocoder {self.provider.name} lookup ({'found' if coordinates else 'not found'}), stats {self.stats}")
+            if coordinates is None:
+                #not cached, the address may be added to the provider's data later
+                self._count("not_found")
+                return None
+            GeocodeCache._get_collection().update_one(
+                {"_id": key},
+                {"$setOnInsert": {"lat": coordinates[0], "lng": coordinates[1],
+                                  "provider": self.provider.name, "hits": 0, "created_at": datetime.utcnow()}},
+                upsert=True
+            )
+
+        with self.lock:
+            self.memory[key] = coordinates
+        return coordinates
+
+
+def get_geocoder():
+    #one geocoder per app, the provider comes from GEOCODER_PROVIDER
+    geocoder = current_app.extensions.get('geocoder')
+    if geocoder is None:
+        config = current_app.config
+        provider = PROVIDERS[config.get('GEOCODER_PROVIDER', 'nominatim')](config)
+        geocoder = Geocoder(provider, config.get('GEOCODE_MEMORY_SIZE', 10000))
+        current_app.extensions['geocoder'] = geocoder
+    return geocoder
+
+
+def geocode(address):
+    return get_geocoder().geocode(address)
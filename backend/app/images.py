@@ -0,0 +1,41 @@
+#resized variants of spot images for the list and map views
+#url_for_images holds the original cloudinary upload url; cloudinary resizes on
+#its side when the transformation is part of the url, so a variant is just a url
+#built with cloudinary_url, memoized per image since listings repeat the same ones
+import re
+from functools import lru_cache
+import cloudinary.utils
+
+VARIANTS = {
+    'thumbnail': {'width': 150, 'height': 150, 'crop': 'fill', 'gravity': 'auto'},
+    'card': {'width': 480, 'height': 320, 'crop': 'fill', 'gravity': 'auto'},
+    'full': {'width': 1600, 'crop': 'limit'},
+}
+
+#https://res.cloudinary.com/<cloud>/image/upload/[<transformations>/][v<version>/]<public id>.<format>
+UPLOAD_URL_RE = re.compile(
+    r"^https?://res\.cloudinary\.com/(?P<cloud>[^/]+)/image/upload/"
+    r"(?:(?:[^/]+/)*?v(?P<version>\d+)/)?" #anything before the version is an existing transformation
+    r"(?P<public_id>.+?)(?:\.(?P<format>[A-Za-z0-9]+))?$"
+)
+
+
+@lru_cache(maxsize=4096)
+def image_variants(url):
+    #{variant: url} for a cloudinary upload url, None for anything else (or no image)
+    match = UPLOAD_URL_RE.match(url or '')
+    if not match:
+        return None
+    variants = {}
+    for name, transformation in VARIANTS.items():
+        variants[name], _ = cloudinary.utils.cloudinary_url(
+            match.group('public_id'),
+            cloud_name=match.group('cloud'),
+            version=match.group('version'),
+            format=match.group('format'),
+            secure=True,
+            quality='auto',
+            fetch_format='auto',
+            **transformation
+        )
+    return variants
@@ -0,0 +1,257 @@
+#write-behind buffer for like toggles, off unless LIKE_BUFFER_ENABLED
+#a like/unlike storm on one spot mostly cancels itself out, so toggles are kept
+#per (user, target) in memory and only the net change is written when the
+#buffer is flushed; reads go through likes.py, which adds the buffered state
+#on top of what is stored so nobody sees a toggle go missing
+import atexit
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from flask import current_app
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .model import Like, Comment
+from .utils import bulk_write
+from .versions import SPOTS_VERSION, comments_version, bump_version
+from . import trending
+
+
+class LikeBuffer:
+    def __init__(self, app, interval, max_pending):
+        self.app = app
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = {} #(user_id, target_type, target_id) -> [liked in mongo, liked now]
+        self.inflight = {} #the pairs a running flush is writing, same shape as pending
+        self.deltas = defaultdict(int) #(target_type, target_id) -> like_count change not written yet
+        #held while a flush applies its like_count changes and while a reader combines stored
+        #state with the buffer; mongo is read before taking it, at a known generation, and a
+        #flush bumps the generation, so a count is never seen with a change applied both in
+        #mongo and in the buffer; no mongo round trip happens under it except the flush's counts
+        self.lock = threading.RLock()
+        self.generation = 0
+        #bumped by every toggle and flush, part of the etags of responses that show buffered likes;
+        #the token keeps two processes' counters apart
+        self.token = uuid.uuid4().hex[:8]
+        self.changes = 0
+        self.flush_lock = threading.Lock() #one flush at a time
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='like-buffer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                self.app.logger.error(f"error flushing buffered likes: {str(e)}")
+
+    def close(self):
+        #stops the flush thread and writes whatever is left
+        self.stopped.set()
+        self.flush()
+
+    def toggle(self, user_id, target_type, target_id, liked_in_mongo):
+        #liked_in_mongo is what was stored at the caller's generation, used when this pair is not
+        #buffered yet; returns the new state
+        key = (user_id, target_type, target_id)
+        with self.lock:
+            self.changes += 1
+            entry = self.pending.get(key)
+            if entry is None:
+                #a pair being flushed is about to be stored as the flush has it
+                entry = [self.inflight[key][1] if key in self.inflight else liked_in_mongo, None]
+                current = entry[0]
+            else:
+                current = entry[1]
+            entry[1] = not current
+            self.deltas[(target_type, target_id)] += 1 if entry[1] else -1
+            if entry[1] == entry[0]:
+                #back to what is stored, nothing left to write
+                self.pending.pop(key, None)
+            else:
+                self.pending[key] = entry
+        return entry[1]
+
+    def flush_if_full(self):
+        #called by the toggling request once it no longer holds the lock
+        with self.lock:
+            full = len(self.pending) >= self.max_pending
+        if full:
+            try:
+                self.flush()
+            except Exception as e:
+                #the toggle is buffered either way, the next flush retries the write
+                self.app.logger.error(f"error flushing buffered likes: {str(e)}")
+
+    def etag_marker(self):
+        with self.lock:
+            return self.token, self.changes
+
+    def liked_overrides(self, user_id, target_type, target_ids):
+        #{target_id: liked} for the buffered pairs among target_ids
+        with self.lock:
+            overrides = {}
+            for target_id in target_ids:
+                key = (user_id, target_type, target_id)
+                entry = self.pending.get(key) or self.inflight.get(key)
+                if entry is not None:
+                    overrides[target_id] = entry[1]
+            return overrides
+
+    def count_deltas(self, target_type, target_ids):
+        with self.lock:
+            return {
+                target_id: self.deltas[(target_type, target_id)]
+                for target_id in target_ids if self.deltas.get((target_type, target_id))
+            }
+
+    def flush(self):
+        #writes the net state of every buffered pair, returns how many pairs were written
+        #the pairs move to inflight under the lock and are written outside it with bulk writes,
+        #toggles and reads only wait while the like_count changes are applied
+        from .cache import get_spot_cache
+        with self.flush_lock, self.app.app_context():
+            with self.lock:
+                if not self.pending:
+                    return 0
+                self.inflight, self.pending = self.pending, {}
+            written, applied, liked, unliked = self._write_likes(list(self.inflight.items()))
+
+            with self.lock:
+                self.generation += 1
+                self.changes += 1
+                try:
+                    self._apply_counts(applied)
+                finally:
+                    #pairs whose write failed go back to pending against what is really stored
+                    for key, (was_liked, flushed) in self.inflight.items():
+                        if key in written:
+                            continue
+                        now_liked = self.pending[key][1] if key in self.pending else flushed
+                        if now_liked == was_liked:
+                            self.pending.pop(key, None)
+                        else:
+                            self.pending[key] = [was_liked, now_liked]
+                    self.inflight = {}
+                    self.deltas = defaultdict(int)
+                    for (_, target_type, target_id), (was_liked, now_liked) in self.pending.items():
+                        self.deltas[(target_type, target_id)] += int(now_liked) - int(was_liked)
+
+            #trending, caches and etags follow what was written, none of it needs the lock
+            for target_id, at in liked:
+                trending.record_like(target_id, at)
+            for target_id, liked_at in unliked:
+                trending.record_unlike(target_id, liked_at)
+            cache = get_spot_cache()
+            spot_ids = {target_id for (_, target_type, target_id) in written if target_type == 'spot'}
+            for spot_id in spot_ids:
+                cache.spot_liked(spot_id)
+            comment_ids = [target_id for (_, target_type, target_id) in written if target_type == 'comment']
+            spots_commented = set(Comment.objects(id__in=comment_ids).scalar('parking_spot')) if comment_ids else set()
+            names = ([SPOTS_VERSION] if spot_ids else []) + [comments_version(getattr(spot, 'id', spot)) for spot in spots_commented]
+            if names:
+                bump_version(*names)
+            return len(written)
+
+    def _write_likes(self, items):
+        #returns (pairs written, {(target_type, target_id): like_count change},
+        #[(spot_id, liked_at)] for new spot likes, [(spot_id, liked_at)] for removed spot likes)
+        likes = Like._get_collection()
+        now = datetime.utcnow()
+        written, applied, liked, unliked = set(), defaultdict(int), [], []
+
+        def query(key):
+            user_id, target_type, target_id = key
+            return {"user": user_id, "target_type": target_type, "target_id": target_id}
+
+        to_like = [key for key, (_, now_liked) in items if now_liked]
+        to_unlike = [key for key, (_, now_liked) in items if not now_liked]
+        if to_like:
+            #a spot or comment deleted since the toggle would be left with an orphan like,
+            #those pairs are dropped as if written
+            existing = self._existing_targets(to_like)
+            written.update(key for key in to_like if key[1:] not in existing)
+            to_like = [key for key in to_like if key[1:] in existing]
+        if to_like:
+            requests = [UpdateOne(query(key), {"$setOnInsert": {"created_at": now}}, upsert=True) for key in to_like]
+            try:
+                upserted = bulk_write(likes, requests, ordered=False)
+                written.update(to_like)
+            except BulkWriteError as e:
+                #unordered, so everything but the failed requests went through
+                upserted = {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+                failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                written.update(key for index, key in enumerate(to_like) if index not in failed)
+                self.app.logger.error(f"error flushing buffered likes: {str(e)}")
+            except Exception as e:
+                upserted = {}
+                self.app.logger.error(f"error flushing buffered likes: {str(e)}")
+            #only likes that were really inserted change like_count
+            for index in upserted:
+                _, target_type, target_id = to_like[index]
+                applied[(target_type, target_id)] += 1
+                if target_type == 'spot':
+                    liked.append((target_id, now))
+        if to_unlike:
+            try:
+                found = list(likes.find({"$or": [query(key) for key in to_unlike]},
+                                        {"target_type": 1, "target_id": 1, "created_at": 1}))
+                if found:
+                    likes.delete_many({"_id": {"$in": [doc["_id"] for doc in found]}})
+                written.update(to_unlike)
+            except Exception as e:
+                found = []
+                self.app.logger.error(f"error flushing buffered likes: {str(e)}")
+            for doc in found:
+                applied[(doc["target_type"], doc["target_id"])] -= 1
+                if doc["target_type"] == 'spot':
+                    unliked.append((doc["target_id"], doc.get("created_at")))
+        return written, applied, liked, unliked
+
+    def _existing_targets(self, keys):
+        #{(target_type, target_id)} among the keys' targets that are still stored, one query per type
+        from .likes import TARGETS
+        existing = set()
+        for target_type, document in TARGETS.items():
+            ids = list({target_id for (_, key_type, target_id) in keys if key_type == target_type})
+            if ids:
+                existing.update((target_type, doc["_id"])
+                                for doc in document._get_collection().find({"_id": {"$in": ids}}, {"_id": 1}))
+        return existing
+
+    def _apply_counts(self, applied):
+        #one bulk write per target collection
+        from .likes import TARGETS
+        for target_type, document in TARGETS.items():
+            bulk_write(document._get_collection(), [
+                UpdateOne({"_id": target_id}, {"$inc": {"like_count": delta}})
+                for (changed_type, target_id), delta in applied.items() if changed_type == target_type and delta
+            ], ordered=False)
+
+
+_create_lock = threading.Lock()
+
+
+def get_like_buffer():
+    #None unless LIKE_BUFFER_ENABLED, otherwise one buffer per app started on first use
+    if not current_app.config.get('LIKE_BUFFER_ENABLED', False):
+        return None
+    buffer = current_app.extensions.get('like_buffer')
+    if buffer is None:
+        with _create_lock:
+            buffer = current_app.extensions.get('like_buffer')
+            if buffer is None:
+                buffer = LikeBuffer(
+                    current_app._get_current_object(),
+                    interval=current_app.config.get('LIKE_BUFFER_FLUSH_INTERVAL', 1.0),
+                    max_pending=current_app.config.get('LIKE_BUFFER_MAX_PENDING', 1000)
+                )
+                buffer.start()
+                current_app.extensions['like_buffer'] = buffer
+    return buffer
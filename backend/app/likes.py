@@ -0,0 +1,112 @@
+#likes for parking spots and comments
+#each like is its own document in the likes collection, the spot or comment only
+#keeps a like_count, so popular documents stay small and is_liked for a whole
+#page is one indexed query
+from bson import ObjectId
+from mongoengine.errors import NotUniqueError
+from .model import Like, ParkingSpot, Comment
+from .like_buffer import get_like_buffer
+from . import trending
+
+TARGETS = {'spot': ParkingSpot, 'comment': Comment}
+
+
+def toggle_like(target_type, target_id, user):
+    #returns (is_liked, like_count), or None when the spot/comment does not exist
+    buffer = get_like_buffer()
+    if buffer is not None:
+        return _toggle_buffered(buffer, target_type, target_id, user)
+    targets = TARGETS[target_type].objects(id=target_id).only('like_count')
+
+    #the unique (user, target_type, target_id) index makes delete/insert the membership test
+    removed = Like._get_collection().find_one_and_delete(
+        {"user": user.id, "target_type": target_type, "target_id": ObjectId(target_id)}, projection={"created_at": 1}
+    )
+    if removed:
+        target = targets.modify(new=True, dec__like_count=1)
+        if target and target_type == 'spot':
+            trending.record_unlike(target.id, removed.get("created_at"))
+        return (False, target.like_count) if target else None
+
+    try:
+        like = Like(user=user, target_type=target_type, target_id=target_id)
+        like.save(force_insert=True)
+    except NotUniqueError:
+        #a concurrent request from the same user already liked it
+        target = targets.first()
+        return (True, target.like_count) if target else None
+
+    target = targets.modify(new=True, inc__like_count=1)
+    if target is None:
+        #liked something that does not exist, undo
+        Like.objects(user=user, target_type=target_type, target_id=target_id).delete()
+        return None
+    if target_type == 'spot':
+        trending.record_like(target.id, like.created_at)
+    return True, target.like_count
+
+
+def likes_buffered():
+    #with the write-behind buffer on, LikeBuffer.flush invalidates caches and bumps versions
+    #for the likes it writes, so the endpoints do not write anything per toggle
+    return get_like_buffer() is not None
+
+
+def _toggle_buffered(buffer, target_type, target_id, user):
+    #two indexed reads and no writes, the like is written when the buffer flushes
+    #the reads run without the buffer lock; if a flush changed what is stored meanwhile they
+    #are repeated, so the count is never combined with changes the flush already applied
+    while True:
+        with buffer.lock:
+            generation = buffer.generation
+        target = TARGETS[target_type].objects(id=target_id).only('like_count').as_pymongo().first()
+        if target is None:
+            return None
+        target_id = target['_id']
+        liked_in_mongo = Like.objects(user=user, target_type=target_type, target_id=target_id).only('id').first() is not None
+        with buffer.lock:
+            if buffer.generation != generation:
+                continue
+            liked = buffer.toggle(user.id, target_type, target_id, liked_in_mongo)
+            like_count = target.get('like_count', 0) + buffer.count_deltas(target_type, [target_id]).get(target_id, 0)
+        break
+    buffer.flush_if_full()
+    return liked, like_count
+
+
+def liked_ids(user, target_type, target_ids):
+    #which of target_ids the user has liked, one query for the whole page
+    if not user or not target_ids:
+        return set()
+    target_ids = [ObjectId(target_id) for target_id in target_ids]
+    buffer = get_like_buffer()
+    if buffer is None:
+        return set(Like.objects(user=user, target_type=target_type, target_id__in=target_ids).scalar('target_id'))
+    while True:
+        with buffer.lock:
+            generation = buffer.generation
+        liked = set(Like.objects(user=user, target_type=target_type, target_id__in=target_ids).scalar('target_id'))
+        with buffer.lock:
+            if buffer.generation != generation:
+                continue #a flush stored likes while we read, read again
+            for target_id, is_liked in buffer.liked_overrides(user.id, target_type, target_ids).items():
+                if is_liked:
+                    liked.add(target_id)
+                else:
+                    liked.discard(target_id)
+        return liked
+
+
+def like_buffer_marker():
+    #None when the buffer is off, otherwise a value that changes with every buffered toggle and
+    #flush; responses that add buffered likes on top of mongo put it in their etag
+    buffer = get_like_buffer()
+    return buffer.etag_marker() if buffer is not None else None
+
+
+def like_count_deltas(target_type, target_ids):
+    #{target_id: change} for likes still waiting in the write-behind buffer, empty when it is off
+    buffer = get_like_buffer()
+    if buffer is None or not target_ids:
+        return {}
+    return buffer.count_deltas(target_type, [ObjectId(target_id) for target_id in target_ids])
@@ -1,12 +1,23 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from .model import ParkingSpot, User, Message
+from .fields import parse_fields, projection_for
+from .versions import USERS_VERSION, conversation_version, bump_version, get_versions, make_etag, not_modified, set_validators
 from datetime import datetime
 import cloudinary.utils
 import time
 
 message_bp=Blueprint('message',__name__,url_prefix='/api/message')
 
+#inbox response field -> Message fields it is built from, for ?fields=
+INBOX_FIELDS = {
+    "user_id": (),
+    "username": (),
+    "profile_image": (),
+    "last_message": ("message",),
+    "timestamp": ("created_at",),
+}
+
 @message_bp.route('/send', methods=['POST'])
 @jwt_required()
 def sender():
@@ -40,6 +51,7 @@ def sender():
             created_at=datetime.now(),
         )   
         message.save()
+        bump_version(conversation_version(current_user.id, receiver.id))
 
         return jsonify({"message":"message sent successfully"}),200
     except Exception as e:
@@ -55,33 +67,47 @@ def inbox():
         
         if not current_user:
             return jsonify({"error": "user not found"}), 404
+        try:
+            fields = parse_fields(request.args.get('fields'), INBOX_FIELDS)
+        except ValueError:
+            return jsonify({"error": "Invalid fields"}), 400
 
         from mongoengine.queryset.visitor import Q #import Q for using or logic in queries
         
+        only = projection_for(fields, INBOX_FIELDS, always=('sender', 'receiver'))
         messages = Message.objects(#get messages where user is either sender or receiver
             Q(sender=current_user) | Q(receiver=current_user)
-        ).order_by('-created_at')
+        ).only(*only).order_by('-created_at').as_pymongo()
         
         #dictionary that groups by other user to get unique conversations
-        conversations = {}
+        latest = {}
         for msg in messages:
             #determine who the other person is
-            if msg.sender == current_user:
-                other_user = msg.receiver
+            if msg['sender'] == current_user.id:
+                other_user_id = msg['receiver']
             else:
-                other_user = msg.sender
-                
-            other_user_id = str(other_user.id)
+                other_user_id = msg['sender']
             
             #since its ordered by created_at in descending the first time we see a user its the most recent message
-            if other_user_id not in conversations:
-                conversations[other_user_id] = {
-                    "user_id": other_user_id,
-                    "username": other_user.username,
-                    "profile_image": other_user.profile_image,
-                    "last_message": msg.message,
-                    "timestamp": msg.created_at
-                }
+            if other_user_id not in latest:
+                latest[other_user_id] = msg
+        
+        other_users = {}
+        if fields & {"username", "profile_image"}:
+            #all the other users with one query instead of one per message
+            other_users = {user.id: user for user in User.objects(id__in=list(latest)).only('username', 'profile_image')}
+        
+        conversations = {}
+        for other_user_id, msg in latest.items():
+            other_user = other_users.get(other_user_id)
+            values = {
+                "user_id": lambda: str(other_user_id),
+                "username": lambda: other_user.username if other_user else None,
+                "profile_image": lambda: other_user.profile_image if other_user else None,
+                "last_message": lambda: msg.get('message'),
+                "timestamp": lambda: msg.get('created_at'),
+            }
+            conversations[other_user_id] = {field: value() for field, value in values.items() if field in fields}
         
         return jsonify({"inbox": list(conversations.values())}), 200
         
@@ -101,6 +127,13 @@ def get_conversation(user_id):
         if not current_user or not second_user: #check if users exist
             return jsonify({"error": "user not found"}), 404
 
+        #answer with 304 before loading the messages if the client has this version
+        versions, last_modified = get_versions(conversation_version(current_user.id, second_user.id), USERS_VERSION)
+        etag = make_etag(versions, str(current_user.id), str(second_user.id))
+        unchanged = not_modified(etag, last_modified)
+        if unchanged:
+            return unchanged
+
         #get messages between these two users
         from mongoengine.queryset.visitor import Q
         messages = Message.objects( (Q(sender=current_user) & 
@@ -117,14 +150,15 @@ def get_conversation(user_id):
                 "timestamp": msg.created_at
             })
 
-        return jsonify({
+        response = jsonify({
             "messages": chat_history,
             "other_user": {
                 "username": second_user.username,
                 "profile_image": second_user.profile_image,
                 "id": str(second_user.id)
             }
-        }), 200  #list of messages and user info
+        })
+        return set_validators(response, etag, last_modified), 200  #list of messages and user info
     except Exception as e:
         current_app.logger.error(f"error fetching conversation: {str(e)}")
         return jsonify({"error": "internal server error"}), 500
\ No newline at end of file
@@ -28,6 +28,7 @@ class ParkingSpot(db.Document):
     # Coordinates
     lat = db.FloatField()
     lng = db.FloatField()
+    location = db.PointField(auto_index=False) #geojson [lng, lat] kept in sync with lat/lng on save
     
     
     # Owner reference
@@ -36,12 +37,27 @@ class ParkingSpot(db.Document):
     # Timestamps
     created_at = db.DateTimeField(default=datetime.now)
     updated_at = db.DateTimeField(default=datetime.now)
-    likes = db.ListField(db.ReferenceField(User))
+    likes = db.ListField(db.ReferenceField(User)) #legacy embedded likes, moved to Like by `flask migrate-likes`
+    like_count = db.IntField(default=0) #number of Like documents, updated atomically by toggle_like
+    comment_preview = db.ListField(db.DictField()) #latest top-level comments, newest first, see COMMENT_PREVIEW_SIZE
+    comment_count = db.IntField(default=0) #number of Comment documents, $inc'd by create/delete comment, `flask recount-comments` fixes drift
+    version = db.IntField(default=0) #bumped by every update_post, edits against an older version get a 409
+    trending_score = db.FloatField(default=0) #decayed activity scaled to trending_epoch, see app/trending.py
+    trending_epoch = db.DateTimeField()
     
     meta = {
         'collection': 'parking_spots',
         'indexes': [
-            'owner'
+            'owner',
+            ('-created_at', '-id'), #keyset pagination for the spot listing
+            '(location', #2dsphere index for near=/bbox= searches
+            'tags', #multikey index for tags= filters
+            ('-trending_score', 'id'), #covers the /trending read
+            { #text index for q= searches, weights match app/search.py
+                'fields': ['$title', '$tags', '$address', '$description'],
+                'default_language': 'english',
+                'weights': {'title': 10, 'tags': 5, 'address': 3, 'description': 1}
+            }
         ]
     }
     
@@ -49,22 +65,111 @@ class ParkingSpot(db.Document):
         if not self.created_at:
             self.created_at = datetime.now()
         self.updated_at = datetime.now()
+        if self.lat is not None and self.lng is not None:
+            self.location = [self.lng, self.lat]
         return super(ParkingSpot, self).save(*args, **kwargs)
     
+class SpotCluster(db.Document):
+    #one grid cell of the map cluster index, maintained by app/clusters.py
+    zoom = db.IntField(required=True)
+    x = db.IntField(required=True)
+    y = db.IntField(required=True)
+    count = db.IntField(default=0)
+    sum_lat = db.FloatField(default=0)
+    sum_lng = db.FloatField(default=0)
+    sample_ids = db.ListField(db.ObjectIdField())
+
+    meta = {
+        'collection': 'spot_clusters',
+        'indexes': [
+            {'fields': ['zoom', 'x', 'y'], 'unique': True}
+        ]
+    }
+
+class TagCount(db.Document):
+    #facet count for one tag, maintained by app/tags.py
+    tag = db.StringField(primary_key=True)
+    count = db.IntField(default=0)
+
+    meta = {
+        'collection': 'tag_counts',
+        'indexes': [
+            '-count'
+        ]
+    }
+
 class Comment(db.Document):
     text = db.StringField(required=True)
     author = db.ReferenceField('User', required=True)
     parking_spot = db.ReferenceField('ParkingSpot', required=True)
     created_at = db.DateTimeField(default=datetime.utcnow)
-    likes = db.ListField(db.ReferenceField(User))
+    likes = db.ListField(db.ReferenceField(User)) #legacy embedded likes, moved to Like by `flask migrate-likes`
+    like_count = db.IntField(default=0) #number of Like documents, updated atomically by toggle_like
+    #threaded replies: parent is the comment replied to (None at the top level), ancestors the ids
+    #from the top-level comment down, path the ancestors' ids and its own joined by '/', so sorting
+    #a subtree by path lists it depth first with replies oldest first
+    parent = db.ReferenceField('Comment')
+    ancestors = db.ListField(db.ObjectIdField())
+    path = db.StringField()
+    reply_count = db.IntField(default=0) #number of direct replies, $inc'd by create/delete comment
     
     meta = {
         'collection': 'comments',
         'indexes': [
-            'parking_spot',
+            ('parking_spot', 'parent', '-created_at', '-id'), #keyset pages of a spot's top-level comments, also covers parking_spot alone
+            ('ancestors', 'path'), #a whole subtree in display order with one query
             'created_at'
         ]
     }
+class Like(db.Document):
+    #one user liking one spot or comment, see app/likes.py
+    user = db.ReferenceField(User, required=True)
+    target_type = db.StringField(required=True, choices=('spot', 'comment'))
+    target_id = db.ObjectIdField(required=True)
+    created_at = db.DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection': 'likes',
+        'indexes': [
+            {'fields': ['user', 'target_type', 'target_id'], 'unique': True},
+            ('target_type', 'target_id') #all likes of one spot/comment, for migration and cleanup
+        ]
+    }
+
+class ResourceVersion(db.Document):
+    #counter bumped by every write to a list resource, used for ETags (app/versions.py)
+    name = db.StringField(primary_key=True)
+    version = db.IntField(default=0)
+    updated_at = db.DateTimeField()
+
+    meta = {
+        'collection': 'resource_versions'
+    }
+
+class CleanupTask(db.Document):
+    #queued removal of everything that belonged to a deleted spot, worked off by app/cleanup.py
+    spot_id = db.ObjectIdField(required=True, unique=True)
+    created_at = db.DateTimeField(default=datetime.utcnow)
+    locked_until = db.DateTimeField() #lease of the worker currently on it
+    attempts = db.IntField(default=0)
+
+    meta = {
+        'collection': 'cleanup_tasks'
+    }
+
+class GeocodeCache(db.Document):
+    #normalized address -> coordinates, filled by app/geocoding.py so an address is only looked up once
+    address = db.StringField(primary_key=True)
+    lat = db.FloatField(required=True)
+    lng = db.FloatField(required=True)
+    provider = db.StringField()
+    hits = db.IntField(default=0)
+    created_at = db.DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection': 'geocode_cache'
+    }
+
 class Message(db.Document):
     sender = db.ReferenceField(User, required=True)
     receiver = db.ReferenceField(User, required=True)
@@ -0,0 +1,87 @@
+#helpers for keyset (cursor) pagination shared by the list endpoints
+import base64
+import json
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import current_app
+from mongoengine.queryset.visitor import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def parse_limit(raw_limit, default_key='PAGE_SIZE', max_key='MAX_PAGE_SIZE'):
+    #reads ?limit= and clamps it to the configured maximum
+    default = current_app.config.get(default_key, 50)
+    maximum = current_app.config.get(max_key, 200)
+    if raw_limit is None or raw_limit == '':
+        return default
+    limit = int(raw_limit) #ValueError is handled by the caller as a 400
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, maximum)
+
+
+def encode_cursor(payload):
+    #cursor is opaque to clients, it is just urlsafe base64 of a small json object
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e))
+    if not isinstance(payload, dict):
+        raise InvalidCursor("cursor payload must be an object")
+    return payload
+
+
+def encode_time_cursor(created_at, doc_id):
+    #keyset position for lists sorted by (created_at, id)
+    return encode_cursor({"t": created_at.isoformat(), "id": str(doc_id)})
+
+
+def decode_time_cursor(cursor):
+    payload = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(payload['t']), ObjectId(payload['id'])
+    except (KeyError, TypeError, ValueError, InvalidId) as e:
+        raise InvalidCursor(str(e))
+
+
+def encode_offset_cursor(offset):
+    #for result sets ranked by something other than time (distance, relevance)
+    return encode_cursor({"o": offset})
+
+
+def decode_offset_cursor(cursor):
+    if not cursor:
+        return 0
+    payload = decode_cursor(cursor)
+    offset = payload.get('o')
+    if not isinstance(offset, int) or offset < 0:
+        raise InvalidCursor("bad offset")
+    return offset
+
+
+def page_by_created_at(queryset, cursor, limit):
+    #keyset page over (created_at, id), newest first, queryset is usually as_pymongo()
+    #returns (rows, cursor for the next page or None)
+    if cursor:
+        cursor_time, cursor_id = decode_time_cursor(cursor)
+        #everything strictly after the last item of the previous page in (created_at, id) order
+        queryset = queryset.filter(
+            Q(created_at__lt=cursor_time) | (Q(created_at=cursor_time) & Q(id__lt=cursor_id))
+        )
+    #fetch one extra row so we know if there is another page without counting
+    page = list(queryset.order_by('-created_at', '-id').limit(limit + 1))
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_time_cursor(page[-1]['created_at'], page[-1]['_id'])
+    return page, next_cursor
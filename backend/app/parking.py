@@ -1,6 +1,27 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from mongoengine.errors import ValidationError
 from .model import ParkingSpot, User
+from .pagination import (
+    parse_limit, page_by_created_at, encode_offset_cursor, decode_offset_cursor, InvalidCursor
+)
+from .geo import parse_near, parse_bbox, parse_radius, bbox_center, search_spots
+from . import clusters
+from . import search
+from . import tags
+from . import bulk
+from . import trending
+from .likes import toggle_like, liked_ids, like_count_deltas, likes_buffered, like_buffer_marker
+from .cache import get_spot_cache
+from .feed_cache import get_feed_cache
+from .geocoding import geocode, GeocodingError
+from .images import image_variants
+from .cleanup import enqueue_spot_cleanup
+from .fields import parse_fields, projection_for
+from .utils import parse_object_id
+from .versions import (
+    SPOTS_VERSION, USERS_VERSION, comments_version, bump_version, get_versions, make_etag, not_modified, set_validators
+)
 from datetime import datetime
 import cloudinary.utils
 import time
@@ -19,11 +40,22 @@ def create_parking_spot():
         
         data = request.get_json()
 
-        # Required fields for now: title, address, lat, lng
-        required_fields = ['title', 'address', 'lat', 'lng']
+        # Required fields for now: title, address; lat and lng are looked up from the address when missing
+        required_fields = ['title', 'address']
         for field in required_fields:
             if field not in data:
                 return jsonify({"error": f"Missing required field: {field}"}), 400
+
+        lat, lng = data.get('lat'), data.get('lng')
+        if lat is None or lng is None:
+            try:
+                coordinates = geocode(data['address'])
+            except GeocodingError as e:
+                current_app.logger.error(f"Error geocoding address: {str(e)}")
+                return jsonify({"error": "Could not validate address, try again later"}), 503
+            if coordinates is None:
+                return jsonify({"error": "Address not found. Please try a more specific address."}), 400
+            lat, lng = coordinates
         
         parking_spot = ParkingSpot(
             title=data['title'],
@@ -32,11 +64,17 @@ def create_parking_spot():
             url_for_images=data.get('url_for_images', ''),  # safe default
             tags=data.get('tags', '').split(),
             owner=user,
-            lat=data.get('lat'),
-            lng=data.get('lng'),
+            lat=lat,
+            lng=lng,
         )
         
         parking_spot.save()
+        clusters.add_spot(parking_spot)
+        search.index_spot(parking_spot)
+        tags.update_tag_counts(new_tags=parking_spot.tags)
+        get_spot_cache().spot_created(parking_spot.id)
+        get_feed_cache().spot_created(parking_spot.lat, parking_spot.lng)
+        bump_version(SPOTS_VERSION)
         
         return jsonify({
             "message": "Parking spot created successfully",
@@ -51,79 +89,421 @@ def create_parking_spot():
         return jsonify({"error": "Internal server error"}), 500
 
 
+@parking_bp.route('/spots/bulk', methods=['POST'])
+@jwt_required()
+def bulk_create_parking_spots():
+    #body is csv (text/csv) or a geojson FeatureCollection, ?format= overrides the content type
+    #every valid row is inserted, invalid rows are reported back by row number
+    try:
+        current_user_id = get_jwt_identity()
+        user = User.objects(id=current_user_id).first()
+
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'geojson')
+        try:
+            #utf-8-sig skips a byte order mark, same as `flask import-spots`
+            rows = bulk.parse_rows(request.get_data().decode('utf-8-sig'), fmt)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid {fmt} payload: {str(e)}"}), 400
+
+        max_rows = current_app.config.get('BULK_MAX_ROWS', 50000)
+        if len(rows) > max_rows:
+            return jsonify({"error": f"Too many rows, the limit is {max_rows}"}), 413
+
+        report = bulk.import_spots(rows, user, batch_size=current_app.config.get('BULK_BATCH_SIZE', 1000))
+        return jsonify(report), 201 if report["inserted"] else 400
+
+    except Exception as e:
+        current_app.logger.error(f"Error bulk creating parking spots: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+def _ref_id(ref):
+    #id behind a reference field whether it holds a document, a DBRef or a bare ObjectId
+    return getattr(ref, 'id', ref)
+
+
+def _owner_names(spots):
+    #resolves every owner (and comment preview author) on the page with one query instead of one per spot
+    owner_ids = {_ref_id(spot['owner']) for spot in spots if spot.get('owner')}
+    owner_ids.update(comment['author'] for spot in spots for comment in spot.get('comment_preview') or [] if comment.get('author'))
+    if not owner_ids:
+        return {}
+    return {user.id: user.username for user in User.objects(id__in=owner_ids).only('username')}
+
+
+#response field -> ParkingSpot fields it is built from, for ?fields=
+SPOT_FIELDS = {
+    "id": ("id",),
+    "title": ("title",),
+    "address": ("address",),
+    "description": ("description",),
+    "url_for_images": ("url_for_images",),
+    "image_variants": ("url_for_images",), #thumbnail/card/full urls, see app/images.py
+    "tags": ("tags",),
+    "owner": ("owner",),
+    "time_created": ("created_at",),
+    "lat": ("lat",),
+    "lng": ("lng",),
+    "like_count": ("like_count",),
+    "comment_count": ("comment_count",),
+    "distance_m": (), #only on near=/bbox= listings
+    "is_liked": (), #per user, added by _with_is_liked
+}
+#opt-in extras for the listing, ?include=comment_preview
+SPOT_INCLUDES = {
+    "comment_preview": ("comment_preview",), #latest comments so a feed card needs no /api/comments request
+}
+LISTING_FIELDS = {**SPOT_FIELDS, **SPOT_INCLUDES}
+EXPORT_FIELDS = {field: source for field, source in SPOT_FIELDS.items() if field not in ("distance_m", "is_liked")}
+
+
+def _spot_to_dict(spot, owner_names, fields):
+    #spot is a raw as_pymongo() dict projected to the requested fields
+    values = {
+        "id": lambda: str(spot['_id']),
+        "title": lambda: spot.get('title'),
+        "address": lambda: spot.get('address'),
+        "description": lambda: spot.get('description'),
+        "url_for_images": lambda: spot.get('url_for_images'),
+        "image_variants": lambda: image_variants(spot.get('url_for_images')),
+        "tags": lambda: spot.get('tags', []),
+        "owner": lambda: owner_names.get(_ref_id(spot.get('owner')), "Unknown"),
+        "time_created": lambda: spot.get('created_at'),
+        "lat": lambda: spot.get('lat'),
+        "lng": lambda: spot.get('lng'),
+        "like_count": lambda: spot.get('like_count', 0),
+        "comment_count": lambda: spot.get('comment_count', 0),
+        "comment_preview": lambda: [
+            {
+                "id": str(comment['_id']),
+                "text": comment.get('text'),
+                "author": owner_names.get(comment.get('author'), "Unknown"),
+                "created_at": comment['created_at'].isoformat(),
+            }
+            for comment in spot.get('comment_preview') or []
+        ],
+    }
+    return {field: value() for field, value in values.items() if field in fields}
+
+
+def _parse_geo_args(args):
+    #returns (center, radius_m, bbox) or None when no geo mode was asked for
+    near_arg = args.get('near')
+    bbox_arg = args.get('bbox')
+    if not near_arg and not bbox_arg:
+        return None
+    bbox = parse_bbox(bbox_arg) if bbox_arg else None
+    radius_arg = args.get('radius_m')
+    if near_arg:
+        center = parse_near(near_arg)
+        radius_m = parse_radius(radius_arg)
+    else:
+        #bbox alone is sorted by distance from its center and not radius limited
+        center = bbox_center(bbox)
+        radius_m = parse_radius(radius_arg) if radius_arg else None
+    return center, radius_m, bbox
+
+
+def _search_feed_cache(center, radius_m, skip, limit, only):
+    #same result shape as geo.search_spots, or None when the cache cannot answer
+    ranked = get_feed_cache().search(center, radius_m, skip, limit)
+    if ranked is None:
+        return None
+    spots = {spot['_id']: spot for spot in ParkingSpot.objects(id__in=[spot_id for spot_id, _ in ranked]).only(*only).as_pymongo()}
+    return [(spots[spot_id], distance) for spot_id, distance in ranked if spot_id in spots]
+
+
+def _query_listing(args, fields):
+    #runs the listing query for the request args, reading only what fields needs
+    #returns (error, listing), listing has no per-user fields so it can be cached
+    try:
+        limit = parse_limit(args.get('limit'))
+    except ValueError:
+        return "Invalid limit", None
+
+    try:
+        geo_args = _parse_geo_args(args)
+    except ValueError:
+        return "Invalid geo query", None
+
+    try:
+        tag_query = tags.parse_tags_filter(args)
+    except ValueError:
+        return "Invalid tags filter", None
+
+    query = args.get('q', '').strip()
+    if query and geo_args:
+        #mongodb cannot combine $text with $geoNear in one query
+        return "q cannot be combined with near or bbox", None
+
+    cursor = args.get('cursor')
+    only = projection_for(fields, LISTING_FIELDS, always=('id',))
+    distances = {}
+    try:
+        if query:
+            offset = decode_offset_cursor(cursor)
+            page = search.search_spots(query, skip=offset, limit=limit + 1, extra_query=tag_query, only=only)
+            next_cursor = encode_offset_cursor(offset + limit) if len(page) > limit else None
+            page = page[:limit]
+        elif geo_args:
+            center, radius_m, bbox = geo_args
+            offset = decode_offset_cursor(cursor)
+            results = None
+            if bbox is None and not tag_query:
+                #plain "near me", usually answered by the feed cache cell around center
+                results = _search_feed_cache(center, radius_m, offset, limit + 1, only)
+            if results is None:
+                results = search_spots(center, radius_m=radius_m, bbox=bbox, skip=offset, limit=limit + 1,
+                                       extra_query=tag_query, only=only)
+            next_cursor = encode_offset_cursor(offset + limit) if len(results) > limit else None
+            page = []
+            for spot, distance in results[:limit]:
+                page.append(spot)
+                distances[spot['_id']] = distance
+        else:
+            #the cursor needs created_at even when the client did not ask for it
+            spots = ParkingSpot.objects(__raw__=tag_query or {}).only(*only, 'created_at').as_pymongo()
+            page, next_cursor = page_by_created_at(spots, cursor, limit)
+    except InvalidCursor:
+        return "Invalid cursor", None
+
+    owner_names = _owner_names(page) if "owner" in fields or "comment_preview" in fields else {}
+    spots_data = []
+    for spot in page:
+        spot_data = _spot_to_dict(spot, owner_names, fields)
+        if "distance_m" in fields and spot['_id'] in distances:
+            spot_data["distance_m"] = round(distances[spot['_id']], 1)
+        spots_data.append(spot_data)
+
+    #ids are kept next to the dicts for is_liked and cache invalidation, "id" may not be in fields
+    listing = {"spots": spots_data, "spot_ids": [str(spot['_id']) for spot in page], "next_cursor": next_cursor}
+    return None, (listing, bool(query or geo_args), bool(query or tag_query))
+
+
+def _with_is_liked(spots_data, current_user, spot_ids=None):
+    #adds the per-user is_liked flag to cached spot dicts without touching the cached copies
+    #spot_ids is needed when the dicts themselves were built without "id"
+    if spot_ids is None:
+        spot_ids = [spot["id"] for spot in spots_data]
+    liked = {str(spot_id) for spot_id in liked_ids(current_user, 'spot', spot_ids)}
+    return [dict(spot, is_liked=spot_id in liked) for spot, spot_id in zip(spots_data, spot_ids)]
+
+
+def _with_buffered_like_counts(spots_data, spot_ids):
+    #toggles still in the like write-behind buffer are not in the stored like_count yet
+    deltas = {str(spot_id): delta for spot_id, delta in like_count_deltas('spot', spot_ids).items()}
+    if not deltas:
+        return spots_data
+    return [
+        dict(spot, like_count=spot["like_count"] + deltas[spot_id]) if spot_id in deltas and "like_count" in spot else spot
+        for spot, spot_id in zip(spots_data, spot_ids)
+    ]
+
+
 @parking_bp.route('/spots', methods=['GET'])
 @jwt_required(optional=True)
 def get_parking_spots():
+    try:
+        current_user_id = get_jwt_identity()
+        try:
+            fields = parse_fields(request.args.get('fields'), SPOT_FIELDS)
+        except ValueError:
+            return jsonify({"error": "Invalid fields"}), 400
+        if request.args.get('include'):
+            try:
+                fields |= parse_fields(request.args.get('include'), SPOT_INCLUDES)
+            except ValueError:
+                return jsonify({"error": "Invalid include"}), 400
+
+        cache = get_spot_cache()
+        cache_key = cache.listing_key(request.args)
+        listing, generation = cache.get_listing(cache_key)
+        if listing is not None:
+            versions, last_modified = listing["versions"], listing["last_modified"]
+        else:
+            versions, last_modified = get_versions(SPOTS_VERSION, USERS_VERSION)
+        #is_liked differs per user, so the viewer is part of the etag, and likes still in the
+        #write-behind buffer are added after the cache, so its marker is too
+        etag = make_etag(versions, cache_key, current_user_id, like_buffer_marker())
+        unchanged = not_modified(etag, last_modified)
+        if unchanged:
+            return unchanged
+
+        if listing is None:
+            error, result = _query_listing(request.args, fields)
+            if error:
+                return jsonify({"error": error}), 400
+            listing, offset_paged, filtered = result
+            listing["versions"], listing["last_modified"] = versions, last_modified
+            cache.set_listing(cache_key, listing, generation, offset_paged=offset_paged, filtered=filtered)
+
+        spots_data = _with_buffered_like_counts(listing["spots"], listing["spot_ids"])
+        if "is_liked" in fields:
+            current_user = None
+            if current_user_id:
+                current_user = User.objects(id=current_user_id).first()
+            spots_data = _with_is_liked(spots_data, current_user, listing["spot_ids"])
+        
+        response = jsonify({
+            "spots": spots_data,
+            "next_cursor": listing["next_cursor"]
+        })
+        return set_validators(response, etag, last_modified), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Error fetching parking spots: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+def _export_lines(fields, batch_size):
+    #yields one json line per spot, only batch_size spots are held at a time
+    only = projection_for(fields, SPOT_FIELDS, always=('id',))
+    #a plain server side cursor in _id order, no sort in memory and no skip
+    spots = ParkingSpot.objects.only(*only).order_by('id').as_pymongo().batch_size(batch_size)
+    batch = []
+    for spot in spots:
+        batch.append(spot)
+        if len(batch) >= batch_size:
+            yield from _export_batch(batch, fields)
+            batch = []
+    if batch:
+        yield from _export_batch(batch, fields)
+
+
+def _export_batch(batch, fields):
+    owner_names = _owner_names(batch) if "owner" in fields else {}
+    for spot in batch:
+        yield current_app.json.dumps(_spot_to_dict(spot, owner_names, fields)) + "\n"
+
+
+@parking_bp.route('/spots/export', methods=['GET'])
+def export_parking_spots():
+    #streams every spot as newline delimited json for analytics jobs
+    #?batch_size= controls rows per round trip, ?fields= works like on the listing
+    try:
+        try:
+            batch_size = parse_limit(request.args.get('batch_size'),
+                                     default_key='EXPORT_BATCH_SIZE', max_key='EXPORT_MAX_BATCH_SIZE')
+        except ValueError:
+            return jsonify({"error": "Invalid batch_size"}), 400
+        try:
+            #distance and is_liked only make sense on the listing
+            fields = parse_fields(request.args.get('fields'), EXPORT_FIELDS)
+        except ValueError:
+            return jsonify({"error": "Invalid fields"}), 400
+
+        return current_app.response_class(
+            stream_with_context(_export_lines(fields, batch_size)),
+            mimetype='application/x-ndjson'
+        )
+
+    except Exception as e:
+        current_app.logger.error(f"Error exporting parking spots: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@parking_bp.route('/spots/<post_id>', methods=['GET'])
+@jwt_required(optional=True)
+def get_single_parking_spot(post_id):
     try:
         current_user_id = get_jwt_identity()
         current_user = None
         if current_user_id:
             current_user = User.objects(id=current_user_id).first()
 
-        spots = ParkingSpot.objects().order_by('-created_at')
-        
-        spots_data = []
-        for spot in spots:
-            is_liked = False
-            if current_user and spot.likes:
-                is_liked = current_user in spot.likes
+        cache = get_spot_cache()
+        spot_data, generation = cache.get_spot(post_id)
+        if spot_data is None:
+            spot = ParkingSpot.objects(id=post_id).exclude('likes').first()
+            if not spot:
+                return jsonify({"error": "Spot not found"}), 404
 
-            spots_data.append({
+            spot_data = {
                 "id": str(spot.id),
                 "title": spot.title,
                 "address": spot.address,
                 "description": spot.description,
                 "url_for_images": spot.url_for_images,
+                "image_variants": image_variants(spot.url_for_images),
                 "tags": spot.tags,
                 "owner": getattr(spot.owner, "username", "Unknown"),
                 "time_created": spot.created_at,
-                "lat": spot.lat,
-                "lng": spot.lng,
-                "like_count": len(spot.likes) if spot.likes else 0,
-                "is_liked": is_liked
-            })
+                "like_count": spot.like_count,
+                "comment_count": spot.comment_count,
+                "version": spot.version #sent back with update-post edits
+            }
+            cache.set_spot(post_id, spot_data, generation)
         
-        return jsonify({"spots": spots_data}), 200
+        spot_data = _with_buffered_like_counts([spot_data], [spot_data["id"]])[0]
+        return jsonify({"spot": _with_is_liked([spot_data], current_user)[0]}), 200
         
     except Exception as e:
-        current_app.logger.error(f"Error fetching parking spots: {str(e)}")
+        current_app.logger.error(f"Error fetching single parking spot: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
 
-@parking_bp.route('/spots/<post_id>', methods=['GET'])
-@jwt_required(optional=True)
-def get_single_parking_spot(post_id):
+@parking_bp.route('/clusters', methods=['GET'])
+def get_clusters():
     try:
-        current_user_id = get_jwt_identity()
-        current_user = None
-        if current_user_id:
-            current_user = User.objects(id=current_user_id).first()
+        try:
+            bbox = parse_bbox(request.args.get('bbox', ''))
+            zoom = clusters.clamp_zoom(int(request.args.get('zoom', '')))
+        except ValueError:
+            return jsonify({"error": "bbox and zoom are required"}), 400
+
+        return jsonify({
+            "zoom": zoom,
+            "clusters": clusters.clusters_in_bbox(bbox, zoom)
+        }), 200
 
-        spot = ParkingSpot.objects(id=post_id).first()
-        if not spot:
-            return jsonify({"error": "Spot not found"}), 404
-        
-        is_liked = False
-        if current_user and spot.likes:
-            is_liked = current_user in spot.likes
-
-        spot_data = {
-            "id": str(spot.id),
-            "title": spot.title,
-            "address": spot.address,
-            "description": spot.description,
-            "url_for_images": spot.url_for_images,
-            "tags": spot.tags,
-            "owner": getattr(spot.owner, "username", "Unknown"),
-            "time_created": spot.created_at,
-            "like_count": len(spot.likes) if spot.likes else 0,
-            "is_liked": is_liked
-        }
-        
-        return jsonify({"spot": spot_data}), 200
-        
     except Exception as e:
-        current_app.logger.error(f"Error fetching single parking spot: {str(e)}")
+        current_app.logger.error(f"Error fetching clusters: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@parking_bp.route('/tags', methods=['GET'])
+def get_tags():
+    try:
+        try:
+            limit = parse_limit(request.args.get('limit'), default_key='TAG_FACET_SIZE')
+        except ValueError:
+            return jsonify({"error": "Invalid limit"}), 400
+
+        return jsonify({"tags": tags.top_tags(limit)}), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error fetching tags: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@parking_bp.route('/trending', methods=['GET'])
+def get_trending():
+    #hot spots by time decayed likes and comments, scores are maintained by app/trending.py
+    try:
+        try:
+            limit = parse_limit(request.args.get('limit'), default_key='TRENDING_SIZE')
+        except ValueError:
+            return jsonify({"error": "Invalid limit"}), 400
+
+        ranked = trending.top_spots(limit)
+        fields = set(EXPORT_FIELDS)
+        only = projection_for(fields, SPOT_FIELDS, always=('id',))
+        spots = {spot['_id']: spot for spot in ParkingSpot.objects(id__in=[spot_id for spot_id, _ in ranked]).only(*only).as_pymongo()}
+        owner_names = _owner_names(spots.values())
+        spots_data = []
+        for spot_id, score in ranked:
+            if spot_id in spots:
+                spot_data = _spot_to_dict(spots[spot_id], owner_names, fields)
+                spot_data["trending_score"] = round(score, 4)
+                spots_data.append(spot_data)
+
+        return jsonify({"spots": spots_data}), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error fetching trending spots: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
 
@@ -156,26 +536,57 @@ def update_post(post_id):
         if not user: #user not found
             return jsonify({"error": "User not found"}), 404
         
-        post_to_update= ParkingSpot.objects(id=post_id, owner=user).first() #finds document with id and owner
+        data= request.get_json()
+        
+        # fields that are in the request
+        changes = {field: data[field] for field in ['title', 'description', 'url_for_images'] if field in data}
+        if 'tags' in data:
+            changes['tags'] = data.get('tags', '').split()
+        for field, value in changes.items():
+            try:
+                ParkingSpot._fields[field].validate(value)
+            except ValidationError:
+                return jsonify({"error": f"Invalid {field}"}), 400
+        
+        #only what the diff and the search index need, finds document with id and owner
+        post_to_update = ParkingSpot.objects(id=post_id, owner=user).only(
+            'title', 'description', 'url_for_images', 'tags', 'address', 'version'
+        ).as_pymongo().first()
         
         if not post_to_update:  #missing post id
             return jsonify({"error": "Missing POST ID"}), 400
         
-        data= request.get_json()
+        current_version = post_to_update.get('version', 0)
+        #clients send back the version they read, without it the edit is checked against what we just read
+        expected_version = data.get('version', current_version)
+        if expected_version != current_version:
+            return jsonify({"error": "Post was changed by someone else, reload and try again",
+                            "version": current_version}), 409
         
-        # update fields if they exist in the request
-        for field in ['title', 'description', 'url_for_images']:
-            if field in data:
-                setattr(post_to_update, field, data[field])
-        
-        if 'tags' in data:
-            post_to_update.tags = data.get('tags', '').split()
-
-        post_to_update.save()
+        # only $set what actually changed, the rest of the document is never rewritten
+        changes = {field: value for field, value in changes.items() if post_to_update.get(field) != value}
+        if changes:
+            #spots saved before the version field existed have no version at all
+            version_guard = current_version if current_version else {"$in": [0, None]}
+            result = ParkingSpot._get_collection().update_one(
+                {"_id": post_to_update['_id'], "owner": user.id, "version": version_guard},
+                {"$set": dict(changes, updated_at=datetime.now()), "$inc": {"version": 1}}
+            )
+            if result.matched_count == 0:
+                #another edit landed between our read and this write
+                return jsonify({"error": "Post was changed by someone else, reload and try again"}), 409
+            current_version += 1
+            
+            updated = ParkingSpot._from_son(dict(post_to_update, **changes))
+            search.index_spot(updated)
+            if 'tags' in changes:
+                tags.update_tag_counts(post_to_update.get('tags', []), changes['tags'])
+            get_spot_cache().spot_updated(updated.id)
+            bump_version(SPOTS_VERSION)
         
-        return jsonify({ #success message
+        return jsonify({ #success message with only the fields that changed
             "message": "Parking spot updated successfully",
-            "post":  post_to_update.to_json()    
+            "post": dict(changes, id=str(post_to_update['_id']), version=current_version)
         }), 200
         
     except Exception as e:
@@ -198,6 +609,13 @@ def delete_post(post_id):
             return jsonify({"error": "post not found or unauthorized"}), 404
         
         post_to_delete.delete()
+        clusters.remove_spot(post_to_delete)
+        search.unindex_spot(post_to_delete.id)
+        tags.update_tag_counts(old_tags=post_to_delete.tags)
+        get_spot_cache().spot_deleted(post_to_delete.id)
+        get_feed_cache().spot_deleted(post_to_delete.lat, post_to_delete.lng)
+        bump_version(SPOTS_VERSION, comments_version(post_to_delete.id))
+        enqueue_spot_cleanup(post_to_delete.id) #comments and likes go in the background
         
         return jsonify({"message": "post deleted"}), 200
         
@@ -214,23 +632,22 @@ def like_post(post_id):
         
         if not user:
             return jsonify({"error": "User not found"}), 404
+        try:
+            post_id = parse_object_id(post_id)
+        except ValueError:
+            return jsonify({"error": "Invalid post id"}), 400
             
-        post = ParkingSpot.objects(id=post_id).first()
+        result = toggle_like('spot', post_id, user)
         
-        if not post:
+        if result is None:
             return jsonify({"error": "Post not found"}), 404
-            
-        if user in post.likes:
-            post.likes.remove(user)
-            liked = False
-        else:
-            post.likes.append(user)
-            liked = True
-            
-        post.save()
+        liked, like_count = result
+        if not likes_buffered():
+            get_spot_cache().spot_liked(post_id)
+            bump_version(SPOTS_VERSION)
         
         return jsonify({
-            "like_count": len(post.likes),
+            "like_count": like_count,
             "is_liked": liked
         }), 200
         
@@ -0,0 +1,94 @@
+#full text search over parking spots (q= on the listing)
+#uses the mongodb text index, mongomock has no $text so there we keep a small
+#in-process inverted index that is built once and updated by the write endpoints
+import re
+from collections import defaultdict
+from flask import current_app
+from .model import ParkingSpot
+from .utils import using_mongomock
+
+#same weights as the text index on ParkingSpot
+FIELD_WEIGHTS = {'title': 10, 'tags': 5, 'address': 3, 'description': 1}
+STOPWORDS = {'a', 'an', 'and', 'at', 'by', 'for', 'in', 'is', 'of', 'on', 'or', 'the', 'to', 'with'}
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall((text or '').lower()) if token not in STOPWORDS]
+
+
+class InvertedIndex:
+    def __init__(self):
+        self.postings = defaultdict(dict) #term -> {spot_id: weight}
+        self.doc_terms = {} #spot_id -> set of terms, so removal only touches its own postings
+
+    def add(self, spot):
+        self.remove(spot.id)
+        weights = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            value = getattr(spot, field)
+            if isinstance(value, list):
+                value = ' '.join(value)
+            for term in tokenize(value):
+                weights[term] += weight
+        for term, weight in weights.items():
+            self.postings[term][spot.id] = weight
+        self.doc_terms[spot.id] = set(weights)
+
+    def remove(self, spot_id):
+        for term in self.doc_terms.pop(spot_id, ()):
+            self.postings[term].pop(spot_id, None)
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def search(self, query):
+        #returns [(spot_id, score)] best match first, any term matches like $text
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            for spot_id, weight in self.postings.get(term, {}).items():
+                scores[spot_id] += weight
+        return sorted(scores.items(), key=lambda item: (-item[1], str(item[0])))
+
+
+def _fallback_index(build=True):
+    index = current_app.extensions.get('spot_search_index')
+    if index is None and build:
+        #one scan when the index is first needed, afterwards kept up to date by index_spot/unindex_spot
+        index = InvertedIndex()
+        for spot in ParkingSpot.objects.only(*FIELD_WEIGHTS):
+            index.add(spot)
+        current_app.extensions['spot_search_index'] = index
+    return index
+
+
+def index_spot(spot):
+    #only the fallback needs this, mongodb maintains its own text index
+    index = _fallback_index(build=False)
+    if index is not None:
+        index.add(spot)
+
+
+def unindex_spot(spot_id):
+    index = _fallback_index(build=False)
+    if index is not None:
+        index.remove(spot_id)
+
+
+def search_spots(query, skip=0, limit=50, extra_query=None, only=None):
+    #returns raw spot dicts ordered by relevance, extra_query is a raw filter applied on top
+    #only limits the spot fields that are read, everything but the legacy likes by default
+    spots = ParkingSpot.objects.only(*only) if only else ParkingSpot.objects.exclude('likes')
+    if not using_mongomock():
+        return list(
+            spots.filter(__raw__=extra_query or {}).search_text(query).order_by('$text_score')
+            .skip(skip).limit(limit).as_pymongo()
+        )
+
+    matches = [spot_id for spot_id, _ in _fallback_index().search(query)]
+    if extra_query:
+        #narrow the matches first so paging stays correct, this only reads the matched ids
+        allowed = set(ParkingSpot.objects(id__in=matches, __raw__=extra_query).scalar('id'))
+        matches = [spot_id for spot_id in matches if spot_id in allowed]
+    matches = matches[skip:skip + limit]
+    spots_by_id = {raw['_id']: raw for raw in spots.filter(id__in=matches).as_pymongo()}
+    return [spots_by_id[spot_id] for spot_id in matches if spot_id in spots_by_id]
@@ -0,0 +1,42 @@
+#tag filtering and facet counts for parking spots
+#counts live in tag_counts and are adjusted with $inc by the write endpoints,
+#so /api/parking/tags never has to scan the spots
+from .model import TagCount
+
+
+def parse_tags_filter(args):
+    #tags=a,b with tags_mode=all (spot has every tag) or any (spot has at least one)
+    #returns a raw mongo query or None
+    raw_tags = args.get('tags', '')
+    tags = [tag for tag in (part.strip() for part in raw_tags.split(',')) if tag]
+    if not tags:
+        return None
+    mode = args.get('tags_mode', 'all')
+    if mode not in ('all', 'any'):
+        raise ValueError("tags_mode must be all or any")
+    return {"tags": {"$all" if mode == 'all' else "$in": tags}}
+
+
+def update_tag_counts(old_tags=(), new_tags=()):
+    #applies the difference between a spot's old and new tags
+    old_tags, new_tags = set(old_tags), set(new_tags)
+    collection = TagCount._get_collection()
+    for tag in new_tags - old_tags:
+        collection.update_one({"_id": tag}, {"$inc": {"count": 1}}, upsert=True)
+    for tag in old_tags - new_tags:
+        collection.update_one({"_id": tag}, {"$inc": {"count": -1}})
+        collection.delete_one({"_id": tag, "count": {"$lte": 0}})
+
+
+def add_tag_counts(counts):
+    #counts is {tag: number of new spots with it}, one update per tag for bulk imports
+    collection = TagCount._get_collection()
+    for tag, count in counts.items():
+        collection.update_one({"_id": tag}, {"$inc": {"count": count}}, upsert=True)
+
+
+def top_tags(limit):
+    return [
+        {"tag": tag.tag, "count": tag.count}
+        for tag in TagCount.objects(count__gt=0).order_by('-count', 'tag').limit(limit)
+    ]
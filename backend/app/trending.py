@@ -0,0 +1,136 @@
+#materialized trending score for /api/parking/trending
+#a like or comment at time t adds weight * 2^((t - epoch) / half_life) to the
+#spot's trending_score, which ranks spots exactly like the decayed score
+#sum(weight * 2^((t - now) / half_life)) without ever touching idle spots;
+#`flask refresh-trending` recomputes every score from the raw likes and comments
+#against a new epoch, which also keeps the exponents small
+from collections import defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from pymongo import UpdateOne
+from .model import ParkingSpot, Like, Comment, ResourceVersion
+from .utils import bulk_write
+
+EPOCH_NAME = 'trending' #resource_versions entry whose updated_at is the shared epoch
+EPOCH_CACHE_SECONDS = 60
+MIN_SCORE = 1e-9 #what float rounding leaves behind when every like was taken back
+
+
+def _half_life_seconds():
+    return current_app.config.get('TRENDING_HALF_LIFE_HOURS', 24) * 3600
+
+
+def _scaled(weight, at, epoch):
+    #at is cut to milliseconds like mongo stores it, so an unlike exactly cancels its like
+    at = at.replace(microsecond=at.microsecond // 1000 * 1000)
+    return weight * 2 ** ((at - epoch).total_seconds() / _half_life_seconds())
+
+
+def current_epoch(fresh=False):
+    #the epoch every score is scaled to, read from mongo at most once a minute per app
+    #unless fresh is set
+    cached = current_app.extensions.get('trending_epoch')
+    now = datetime.utcnow()
+    if not fresh and cached is not None and cached[1] > now:
+        return cached[0]
+    collection = ResourceVersion._get_collection()
+    #the first caller picks the epoch, everyone after reads the same one
+    collection.update_one({"_id": EPOCH_NAME}, {"$setOnInsert": {"version": 0, "updated_at": now}}, upsert=True)
+    epoch = collection.find_one({"_id": EPOCH_NAME}, {"updated_at": 1})["updated_at"]
+    current_app.extensions['trending_epoch'] = (epoch, now + timedelta(seconds=EPOCH_CACHE_SECONDS))
+    return epoch
+
+
+def record_activity(spot_id, weight, at=None):
+    #adds one like or comment (positive weight) or takes one back (negative weight) that happened at `at`
+    at = at or datetime.utcnow()
+    collection = ParkingSpot._get_collection()
+    epoch = current_epoch()
+    first = False
+    for _ in range(3):
+        #the epoch filter makes the increment safe against a refresh rescaling the spot meanwhile
+        update = {"$inc": {"trending_score": _scaled(weight, at, epoch)}}
+        if first:
+            #first activity on this spot since it was created or last dropped out
+            update["$set"] = {"trending_epoch": epoch}
+        if collection.update_one({"_id": spot_id, "trending_epoch": None if first else epoch}, update).matched_count:
+            return
+        spot = collection.find_one({"_id": spot_id}, {"trending_epoch": 1})
+        if spot is None:
+            return
+        first = spot.get("trending_epoch") is None
+        if first:
+            #the cached epoch may predate a refresh run by another process, a first
+            #event is scaled to the epoch stored right now
+            epoch = current_epoch(fresh=True)
+        else:
+            if spot["trending_epoch"] != epoch:
+                #a refresh moved the epoch, stop using the cached one
+                current_app.extensions.pop('trending_epoch', None)
+            epoch = spot["trending_epoch"]
+
+
+def record_like(spot_id, at=None):
+    record_activity(spot_id, current_app.config.get('TRENDING_LIKE_WEIGHT', 1.0), at)
+
+
+def record_unlike(spot_id, liked_at):
+    #takes back exactly what the like added
+    record_activity(spot_id, -current_app.config.get('TRENDING_LIKE_WEIGHT', 1.0), liked_at)
+
+
+def record_comment(spot_id, at=None):
+    record_activity(spot_id, current_app.config.get('TRENDING_COMMENT_WEIGHT', 2.0), at)
+
+
+def record_uncomment(spot_id, commented_at):
+    #takes back exactly what the comment added
+    record_activity(spot_id, -current_app.config.get('TRENDING_COMMENT_WEIGHT', 2.0), commented_at)
+
+
+def top_spots(limit):
+    #[(spot_id, decayed score now)], read from the (-trending_score, _id) index alone
+    epoch = current_epoch()
+    decay = 2 ** (-(datetime.utcnow() - epoch).total_seconds() / _half_life_seconds())
+    rows = ParkingSpot._get_collection().find(
+        {"trending_score": {"$gt": MIN_SCORE}}, {"_id": 1, "trending_score": 1}
+    ).sort([("trending_score", -1), ("_id", 1)]).limit(limit)
+    return [(row["_id"], row["trending_score"] * decay) for row in rows]
+
+
+def refresh_trending():
+    #recomputes every score from the likes and comments of the last TRENDING_WINDOW_DAYS
+    #against a new epoch, returns how many spots have a score
+    #activity recorded while this runs can be off until the next refresh
+    now = datetime.utcnow()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000) #mongo keeps milliseconds, see the $ne below
+    since = now - timedelta(days=current_app.config.get('TRENDING_WINDOW_DAYS', 14))
+    like_weight = current_app.config.get('TRENDING_LIKE_WEIGHT', 1.0)
+    comment_weight = current_app.config.get('TRENDING_COMMENT_WEIGHT', 2.0)
+
+    scores = defaultdict(float)
+    likes = Like._get_collection().find(
+        {"target_type": "spot", "created_at": {"$gte": since}}, {"target_id": 1, "created_at": 1}
+    )
+    for like in likes:
+        scores[like["target_id"]] += _scaled(like_weight, like["created_at"], now)
+    comments = Comment._get_collection().find({"created_at": {"$gte": since}}, {"parking_spot": 1, "created_at": 1})
+    for comment in comments:
+        scores[comment["parking_spot"]] += _scaled(comment_weight, comment["created_at"], now)
+
+    ResourceVersion._get_collection().update_one(
+        {"_id": EPOCH_NAME}, {"$inc": {"version": 1}, "$set": {"updated_at": now}}, upsert=True
+    )
+    current_app.extensions.pop('trending_epoch', None)
+    collection = ParkingSpot._get_collection()
+    bulk_write(collection, [
+        UpdateOne({"_id": spot_id}, {"$set": {"trending_score": score, "trending_epoch": now}})
+        for spot_id, score in scores.items()
+    ], ordered=False)
+    #spots that had a score but no recent activity drop out; without an epoch their next
+    #event is a first event again, so spots that stay idle are never written
+    collection.update_many(
+        {"trending_epoch": {"$nin": [now, None]}},
+        {"$set": {"trending_score": 0.0}, "$unset": {"trending_epoch": ""}}
+    )
+    return len(scores)
@@ -0,0 +1,50 @@
+#small helpers shared by the blueprints
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne, DeleteOne
+from .model import ParkingSpot
+
+
+def using_mongomock():
+    #tests may run against mongomock, which lacks $text and the geo operators
+    client = ParkingSpot._get_db().client
+    return type(client).__module__.startswith('mongomock')
+
+
+def bulk_write(collection, requests, ordered=True):
+    #sends UpdateOne/DeleteOne requests in one round trip and returns {request index: upserted _id}
+    #like BulkWriteResult.upserted_ids; mongomock cannot take pymongo's request objects, so there
+    #they are applied one at a time
+    if not requests:
+        return {}
+    if not using_mongomock():
+        return collection.bulk_write(requests, ordered=ordered).upserted_ids
+    upserted = {}
+    for index, request in enumerate(requests):
+        if isinstance(request, UpdateOne):
+            result = collection.update_one(request._filter, request._doc, upsert=request._upsert)
+            if result.upserted_id is not None:
+                upserted[index] = result.upserted_id
+        elif isinstance(request, DeleteOne):
+            collection.delete_one(request._filter)
+        else:
+            raise TypeError(f"unsupported bulk request {type(request).__name__}")
+    return upserted
+
+
+def parse_object_id(raw_id):
+    #ObjectId for an id taken from the url or the body, malformed ids raise ValueError (a 400)
+    #instead of reaching mongoengine and coming back as a 500
+    try:
+        return ObjectId(raw_id)
+    except (InvalidId, TypeError) as e:
+        raise ValueError(f"invalid id: {raw_id!r}") from e
+
+
+def existing_id(document, raw_id, **query):
+    #checks the document exists with an _id-only read and returns its ObjectId, None when it does not;
+    #a ReferenceField accepts the ObjectId, so write paths never load the document itself
+    #query adds raw filters on the same read, e.g. parking_spot= for a comment of a given spot
+    object_id = parse_object_id(raw_id)
+    found = document._get_collection().find_one(dict(query, _id=object_id), projection={"_id": 1})
+    return object_id if found else None
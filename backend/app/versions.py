@@ -0,0 +1,62 @@
+#version counters for conditional GETs
+#every write that changes what a list endpoint returns bumps a named counter,
+#the read side turns the counters into an ETag and answers If-None-Match with
+#a 304 before it queries or serializes anything
+import hashlib
+from datetime import datetime
+from flask import request, current_app
+from werkzeug.http import is_resource_modified
+from .model import ResourceVersion
+
+
+SPOTS_VERSION = 'parking_spots' #anything shown in the spot listing
+USERS_VERSION = 'users' #usernames and profile images are shown inside most lists
+
+
+def comments_version(parking_spot_id):
+    return f'comments:{parking_spot_id}'
+
+
+def conversation_version(user_a, user_b):
+    #same name whichever side of the conversation is asking
+    first, second = sorted([str(user_a), str(user_b)])
+    return f'conversation:{first}:{second}'
+
+
+def bump_version(*names):
+    collection = ResourceVersion._get_collection()
+    now = datetime.utcnow()
+    for name in names:
+        collection.update_one({"_id": name}, {"$inc": {"version": 1}, "$set": {"updated_at": now}}, upsert=True)
+
+
+def get_versions(*names):
+    #returns (tuple of versions in the order asked, newest updated_at) with one query
+    docs = {
+        doc["_id"]: doc
+        for doc in ResourceVersion._get_collection().find({"_id": {"$in": list(names)}})
+    }
+    versions = tuple(docs[name]["version"] if name in docs else 0 for name in names)
+    times = [docs[name]["updated_at"] for name in names if name in docs]
+    return versions, (max(times) if times else None)
+
+
+def make_etag(versions, *parts):
+    #parts are whatever else changes the body: query args, the viewing user
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:16]
+    return f"{'.'.join(str(v) for v in versions)}-{digest}"
+
+
+def not_modified(etag, last_modified=None):
+    #returns a 304 response when the client already has this version, otherwise None
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    response = current_app.response_class(status=304)
+    return set_validators(response, etag, last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
@@ -14,3 +14,74 @@ JWT_SECRET_KEY = None
 JWT_ACCESS_TOKEN_EXPIRES = 86400 #24 hours instead of 15 min expiration for token
 
 WTF_CSRF_ENABLED = False #makes sure csrf does not work for blocking
+
+# Pagination for list endpoints (?limit= is clamped to MAX_PAGE_SIZE)
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Geospatial search on /api/parking/spots (near= and bbox=)
+GEO_DEFAULT_RADIUS_M = 5000
+GEO_MAX_RADIUS_M = 50000
+
+# Map clustering (/api/parking/clusters), one grid level per zoom 0..CLUSTER_MAX_ZOOM
+CLUSTER_MAX_ZOOM = 16
+CLUSTER_CELLS_PER_TILE = 4
+
+# Default number of tags returned by /api/parking/tags
+TAG_FACET_SIZE = 20
+
+# Response cache for the spot listing and single spot reads (SPOT_CACHE_TTL = 0 turns it off)
+SPOT_CACHE_TTL = 30
+SPOT_CACHE_MAXSIZE = 1024
+
+# Streaming export (/api/parking/spots/export), rows fetched per database round trip
+EXPORT_BATCH_SIZE = 500
+EXPORT_MAX_BATCH_SIZE = 5000
+
+# Bulk spot imports (POST /api/parking/spots/bulk and `flask import-spots`)
+BULK_BATCH_SIZE = 1000
+BULK_MAX_ROWS = 50000
+
+# Server side geocoding for spots created with only an address
+# GEOCODER_PROVIDER is 'nominatim' or 'stub' (deterministic, no network, used by the tests)
+GEOCODER_PROVIDER = 'nominatim'
+GEOCODER_URL = 'https://nominatim.openstreetmap.org/search'
+GEOCODER_USER_AGENT = 'ParkingApp/1.0' #required by the nominatim usage policy
+GEOCODER_TIMEOUT = 5
+GEOCODE_MEMORY_SIZE = 10000 #addresses kept in process in front of the geocode_cache collection
+
+# Cleanup of comments and likes left behind by deleted spots (app/cleanup.py)
+CLEANUP_IN_BACKGROUND = True #False leaves queued cleanups for `flask cleanup-deleted-spots`
+CLEANUP_BATCH_SIZE = 500
+CLEANUP_LEASE_SECONDS = 300 #a task claimed by a worker that died is picked up again after this
+
+# Optional write-behind buffer for like toggles (app/like_buffer.py)
+# toggles are kept in memory and their net effect is written every LIKE_BUFFER_FLUSH_INTERVAL
+# seconds, when LIKE_BUFFER_MAX_PENDING toggles are waiting, or when the process exits
+LIKE_BUFFER_ENABLED = False
+LIKE_BUFFER_FLUSH_INTERVAL = 1.0
+LIKE_BUFFER_MAX_PENDING = 1000
+
+# Trending spots (/api/parking/trending), likes and comments count with exponential time decay
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_LIKE_WEIGHT = 1.0
+TRENDING_COMMENT_WEIGHT = 2.0
+TRENDING_WINDOW_DAYS = 14 #`flask refresh-trending` ignores activity older than this
+TRENDING_SIZE = 20
+
+# Feed cache for near= listings, sorted nearby spots per geohash cell (FEED_CACHE_TTL = 0 turns it off)
+FEED_CACHE_TTL = 300
+FEED_CACHE_CELLS = 256
+FEED_CELL_PRECISION = 6 #geohash length, about 1.2km x 0.6km cells
+FEED_MAX_RADIUS_M = 5000 #larger radius_m values skip the cache
+FEED_MAX_SPOTS = 5000 #per cell
+
+# Comments per page on /api/comments/<spot id> (?limit= is clamped to MAX_PAGE_SIZE)
+COMMENTS_PAGE_SIZE = 50
+
+# Threaded replies: replies shown per level, and the most comments one subtree read returns
+COMMENT_REPLIES_PAGE_SIZE = 10
+COMMENT_THREAD_MAX = 500
+
+# Latest top-level comments kept on each spot for ?include=comment_preview on the listing
+COMMENT_PREVIEW_SIZE = 3
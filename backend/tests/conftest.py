@@ -20,6 +20,8 @@ def app():
     app.config['CLOUDINARY_CLOUD_NAME'] = 'test-cloud'
     app.config['CLOUDINARY_API_KEY'] = 'test-api-key'
     app.config['CLOUDINARY_API_SECRET'] = 'test-api-secret'
+    app.config['GEOCODER_PROVIDER'] = 'stub' #never geocode over the network in tests
+    app.config['CLEANUP_IN_BACKGROUND'] = False #tests run queued cleanups themselves
     
     #disconnect any existing connections to the program to prevent conflicts
     try:
@@ -30,22 +32,34 @@ def app():
     
     with app.app_context():
         #this will clear the database before each test for documents
-        from app.model import User, ParkingSpot, Comment, Message
+        from app.model import User, ParkingSpot, Comment, Message, SpotCluster, TagCount, Like, ResourceVersion, GeocodeCache, CleanupTask
         User.objects().delete()
         ParkingSpot.objects().delete()
         Comment.objects().delete()
         Message.objects().delete()
+        SpotCluster.objects().delete()
+        TagCount.objects().delete()
+        Like.objects().delete()
+        ResourceVersion.objects().delete()
+        GeocodeCache.objects().delete()
+        CleanupTask.objects().delete()
         
         yield app
     
     #cleans up after test
     with app.app_context():
         try:
-            from app.model import User, ParkingSpot, Comment, Message
+            from app.model import User, ParkingSpot, Comment, Message, SpotCluster, TagCount, Like, ResourceVersion, GeocodeCache, CleanupTask
             User.objects().delete()
             ParkingSpot.objects().delete()
             Comment.objects().delete()
             Message.objects().delete()
+            SpotCluster.objects().delete()
+            TagCount.objects().delete()
+            Like.objects().delete()
+            ResourceVersion.objects().delete()
+            GeocodeCache.objects().delete()
+            CleanupTask.objects().delete()
         except Exception:
             pass
     
@@ -58,6 +72,20 @@ def app():
 def client(app): #creates test client
     return app.test_client()
 
+@pytest.fixture
+def count_queries(app, monkeypatch):
+    #records every read sent to the database, find_one and reference dereferencing go through find
+    from app.model import User
+    collection_cls = type(User._get_collection())
+    calls = []
+    for name in ('find', 'aggregate'):
+        original = getattr(collection_cls, name)
+        def counting(self, *args, _original=original, _name=name, **kwargs):
+            calls.append((self.name, _name))
+            return _original(self, *args, **kwargs)
+        monkeypatch.setattr(collection_cls, name, counting)
+    return calls
+
 @pytest.fixture
 def sample_google_user_data(): # reusable google user data
     return {
@@ -1,5 +1,5 @@
 import pytest
-from app.model import User, ParkingSpot, Comment
+from app.model import User, ParkingSpot, Comment, Like
 from flask_jwt_extended import create_access_token
 from datetime import datetime
 
@@ -289,9 +289,10 @@ def test_get_comments_with_likes(client):
         text='Test comment',
         author=user1,
         parking_spot=spot,
-        likes=[user2]  # user2 likes this comment
+        like_count=1
     )
     comment.save()
+    Like(user=user2, target_type='comment', target_id=comment.id).save()  # user2 likes this comment
     
     # Test with user1 (not liked)
     access_token1 = create_access_token(identity=str(user1.id))
@@ -370,8 +371,8 @@ def test_like_comment(client):
     
     comment_reloaded = Comment.objects(id=comment_id).first()
     assert comment_reloaded is not None
-    assert len(comment_reloaded.likes) == 1
-    assert user in comment_reloaded.likes
+    assert comment_reloaded.like_count == 1
+    assert Like.objects(user=user, target_type='comment', target_id=comment.id).count() == 1
     
     # Test unliking the comment
     response = client.post(
@@ -385,8 +386,8 @@ def test_like_comment(client):
     
     comment_reloaded = Comment.objects(id=comment_id).first()
     assert comment_reloaded is not None
-    assert len(comment_reloaded.likes) == 0
-    assert user not in comment_reloaded.likes
+    assert comment_reloaded.like_count == 0
+    assert Like.objects(user=user, target_type='comment', target_id=comment.id).count() == 0
 
 
 def test_like_comment_invalid_user(client):
@@ -501,9 +502,8 @@ def test_like_comment_multiple_users(client):
     
     # Verify both users are in likes
     comment_reloaded = Comment.objects(id=comment_id).first()
-    assert len(comment_reloaded.likes) == 2
-    assert user1 in comment_reloaded.likes
-    assert user2 in comment_reloaded.likes
+    assert comment_reloaded.like_count == 2
+    assert set(Like.objects(target_type='comment', target_id=comment.id).scalar('user')) == {user1, user2}
     
     # User1 unlikes
     response1 = client.post(
@@ -517,9 +517,8 @@ def test_like_comment_multiple_users(client):
     
     # Verify only user2 remains
     comment_reloaded = Comment.objects(id=comment_id).first()
-    assert len(comment_reloaded.likes) == 1
-    assert user1 not in comment_reloaded.likes
-    assert user2 in comment_reloaded.likes
+    assert comment_reloaded.like_count == 1
+    assert list(Like.objects(target_type='comment', target_id=comment.id).scalar('user')) == [user2]
 
 def test_server_error_handling(client, mocker):
     """Test server error handling by mocking exceptions"""
@@ -583,7 +582,7 @@ def test_server_error_like_comment(client, mocker):
     access_token = create_access_token(identity=str(user.id))
     
     # Mock an exception
-    mocker.patch('app.comments.Comment.save', side_effect=Exception('Test error'))
+    mocker.patch('app.comments.Comment.objects', side_effect=Exception('Test error'))
     
     response = client.post(
         f'/api/comments/{str(spot.id)}/{str(comment.id)}',
@@ -630,4 +629,200 @@ def test_internal_server_error(client, monkeypatch):
         assert response.json['error'] == 'Internal server error'
     finally:
         # Restore original method
-        Comment.save = original_save
\ No newline at end of file
+        Comment.save = original_save
+
+def test_get_comments_etag(client):
+    """Test conditional GET on the comments of a spot"""
+    user = create_test_user()
+    user.save()
+    spot = create_test_parking_spot(user)
+    spot.save()
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+    client.post(f'/api/comments/{str(spot.id)}', json={'text': 'first'}, headers=headers)
+
+    response = client.get(f'/api/comments/{str(spot.id)}', headers=headers)
+    etag = response.headers['ETag']
+    response = client.get(f'/api/comments/{str(spot.id)}', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+
+    # A new comment changes the etag
+    client.post(f'/api/comments/{str(spot.id)}', json={'text': 'second'}, headers=headers)
+    response = client.get(f'/api/comments/{str(spot.id)}', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.json['comments']) == 2
+
+
+def test_get_comments_fields(client):
+    """Test ?fields= on the comments of a spot"""
+    user = create_test_user()
+    user.save()
+    spot = create_test_parking_spot(user)
+    spot.save()
+    Comment(text='Only comment', author=user, parking_spot=spot).save()
+
+    response = client.get(f'/api/comments/{str(spot.id)}?fields=text,author')
+    assert response.status_code == 200
+    assert response.json['comments'] == [{'text': 'Only comment', 'author': 'testuser'}]
+
+    response = client.get(f'/api/comments/{str(spot.id)}?fields=text,likes')
+    assert response.status_code == 400
+
+
+def test_get_comments_pagination(client, count_queries):
+    """Test limit/before pages of comments with one author query per page"""
+    authors = [create_test_user(f'author{i}@gmail.com', f'author{i}') for i in range(3)]
+    for author in authors:
+        author.save()
+    spot = create_test_parking_spot(authors[0])
+    spot.save()
+    for i in range(5):
+        Comment(text=f'comment {i}', author=authors[i % 3], parking_spot=spot).save()
+
+    count_queries.clear()
+    response = client.get(f'/api/comments/{str(spot.id)}?limit=2')
+    assert response.status_code == 200
+    assert [c['text'] for c in response.json['comments']] == ['comment 4', 'comment 3']
+    assert [c['author'] for c in response.json['comments']] == ['author1', 'author0']
+    assert count_queries.count(('user', 'find')) == 1
+
+    texts = [c['text'] for c in response.json['comments']]
+    before = response.json['next_before']
+    while before:
+        response = client.get(f'/api/comments/{str(spot.id)}?limit=2&before={before}')
+        texts += [c['text'] for c in response.json['comments']]
+        before = response.json['next_before']
+    assert texts == [f'comment {i}' for i in range(4, -1, -1)]
+
+    assert client.get(f'/api/comments/{str(spot.id)}?before=garbage').status_code == 400
+    assert client.get(f'/api/comments/{str(spot.id)}?limit=0').status_code == 400
+
+
+def test_comment_count(client):
+    """Test comment_count follows creating and deleting comments"""
+    user = create_test_user()
+    user.save()
+    other = create_test_user('other@gmail.com', 'other')
+    other.save()
+    spot = create_test_parking_spot(user)
+    spot.save()
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+    other_headers = {'Authorization': f'Bearer {create_access_token(identity=str(other.id))}'}
+
+    ids = [
+        client.post(f'/api/comments/{str(spot.id)}', json={'text': text}, headers=headers).json['comment']['id']
+        for text in ('first', 'second')
+    ]
+    assert client.get(f'/api/parking/spots/{str(spot.id)}').json['spot']['comment_count'] == 2
+    client.post(f'/api/comments/{str(spot.id)}/{ids[0]}', headers=other_headers)
+
+    # Only the author can delete a comment
+    response = client.delete(f'/api/comments/{str(spot.id)}/{ids[0]}', headers=other_headers)
+    assert response.status_code == 404
+
+    response = client.delete(f'/api/comments/{str(spot.id)}/{ids[0]}', headers=headers)
+    assert response.status_code == 200
+    assert Comment.objects(id=ids[0]).first() is None
+    assert Like.objects(target_type='comment').count() == 0
+    assert ParkingSpot.objects(id=spot.id).first().comment_count == 1
+    assert client.get(f'/api/parking/spots/{str(spot.id)}').json['spot']['comment_count'] == 1
+
+    # Deleting it again does not decrement twice
+    response = client.delete(f'/api/comments/{str(spot.id)}/{ids[0]}', headers=headers)
+    assert response.status_code == 404
+    assert ParkingSpot.objects(id=spot.id).first().comment_count == 1
+
+
+def test_comment_replies(client, count_queries):
+    """Test threaded replies, reply counts and one query per subtree"""
+    user = create_test_user()
+    user.save()
+    spot = create_test_parking_spot(user)
+    spot.save()
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+    def post(text, parent_id=None):
+        response = client.post(f'/api/comments/{str(spot.id)}', json={'text': text, 'parent_id': parent_id}, headers=headers)
+        assert response.status_code == 201
+        return response.json['comment']['id']
+
+    root = post('root')
+    first = post('first', root)
+    post('first.a', first)
+    post('first.b', first)
+    post('first.c', first)
+    second = post('second', root)
+    post('second.a', second)
+    post('third', root)
+
+    # Replies stay out of the top-level list
+    response = client.get(f'/api/comments/{str(spot.id)}')
+    assert [(c['text'], c['reply_count']) for c in response.json['comments']] == [('root', 3)]
+    assert ParkingSpot.objects(id=spot.id).first().comment_count == 8
+
+    count_queries.clear()
+    response = client.get(f'/api/comments/{str(spot.id)}/{root}/replies?limit=2&fields=text,reply_count')
+    assert response.status_code == 200
+    assert count_queries.count(('comments', 'find')) == 2 # the root and its whole subtree
+    thread = response.json
+    assert [r['text'] for r in thread['replies']] == ['first', 'second']
+    first_replies = thread['replies'][0]
+    assert [r['text'] for r in first_replies['replies']] == ['first.a', 'first.b']
+    assert first_replies['reply_count'] == 3
+    assert [r['text'] for r in thread['replies'][1]['replies']] == ['second.a']
+    assert thread['replies'][1]['next_after'] is None
+
+    # Every level pages on its own
+    response = client.get(f"/api/comments/{str(spot.id)}/{first}/replies?limit=2&after={first_replies['next_after']}")
+    assert [r['text'] for r in response.json['replies']] == ['first.c']
+    assert response.json['next_after'] is None
+    response = client.get(f"/api/comments/{str(spot.id)}/{root}/replies?limit=2&after={thread['next_after']}")
+    assert [r['text'] for r in response.json['replies']] == ['third']
+    assert response.json['next_after'] is None
+    response = client.get(f"/api/comments/{str(spot.id)}/{second}/replies?after={thread['next_after']}")
+    assert response.status_code == 400
+
+    # Replying to a comment of another spot is refused
+    other_spot = create_test_parking_spot(user, 'Other')
+    other_spot.save()
+    response = client.post(f'/api/comments/{str(other_spot.id)}', json={'text': 'x', 'parent_id': root}, headers=headers)
+    assert response.status_code == 404
+
+    # Deleting a reply takes its own replies with it
+    response = client.delete(f'/api/comments/{str(spot.id)}/{first}', headers=headers)
+    assert response.status_code == 200
+    assert Comment.objects(parking_spot=spot).count() == 4
+    assert Comment.objects(id=root).first().reply_count == 2
+    assert ParkingSpot.objects(id=spot.id).first().comment_count == 4
+
+
+def test_malformed_ids_are_rejected(client):
+    """Test malformed ids get a 400 and the write paths only check existence"""
+    user = create_test_user()
+    user.save()
+    spot = create_test_parking_spot(user)
+    spot.save()
+    comment = Comment(text='hello', author=user, parking_spot=spot)
+    comment.save()
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+    assert client.post('/api/comments/not-an-id', json={'text': 'x'}, headers=headers).status_code == 400
+    assert client.post(f'/api/comments/{str(spot.id)}', json={'text': 'x', 'parent_id': 'bad'}, headers=headers).status_code == 400
+    assert client.post(f'/api/comments/{str(spot.id)}/bad', headers=headers).status_code == 400
+    assert client.delete(f'/api/comments/{str(spot.id)}/bad', headers=headers).status_code == 400
+    assert client.post('/api/parking/spots/bad', headers=headers).status_code == 400
+    assert client.get('/api/comments/bad').status_code == 400
+    assert client.get('/api/comments/bad/bad/replies').status_code == 400
+    assert client.get(f'/api/comments/{str(spot.id)}/bad/replies').status_code == 400
+    assert client.get(f'/api/comments/{str(spot.id)}/{str(spot.id)}/replies').status_code == 404
+
+    # Liking through another spot's url does not find the comment
+    other = create_test_parking_spot(user, 'Other')
+    other.save()
+    response = client.post(f'/api/comments/{str(other.id)}/{str(comment.id)}', headers=headers)
+    assert response.status_code == 404
+    assert Like.objects.count() == 0
+
+    # The reference is built from the id alone
+    response = client.post(f'/api/comments/{str(spot.id)}', json={'text': 'x'}, headers=headers)
+    assert response.status_code == 201
+    assert Comment.objects(id=response.json['comment']['id']).first().parking_spot == spot
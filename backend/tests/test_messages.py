@@ -775,4 +775,43 @@ def test_inbox_many_conversations(client):
     # Should be ordered by most recent (descending created_at)
     # Last user (user4 at 14:00) should be first
     assert inbox[0]['username'] == 'user4'
-    assert inbox[4]['username'] == 'user0'
\ No newline at end of file
+    assert inbox[4]['username'] == 'user0'
+
+def test_get_conversation_etag(client):
+    """Test conditional GET on a conversation"""
+    user1 = create_test_user('etag1@gmail.com', 'etag1')
+    user1.save()
+    user2 = create_test_user('etag2@gmail.com', 'etag2')
+    user2.save()
+    headers1 = {'Authorization': f'Bearer {create_access_token(identity=str(user1.id))}'}
+    headers2 = {'Authorization': f'Bearer {create_access_token(identity=str(user2.id))}'}
+    client.post('/api/message/send', json={'receiver_username': 'etag2', 'message': 'Hello'}, headers=headers1)
+
+    response = client.get(f'/api/message/{str(user2.id)}', headers=headers1)
+    etag = response.headers['ETag']
+    response = client.get(f'/api/message/{str(user2.id)}', headers={**headers1, 'If-None-Match': etag})
+    assert response.status_code == 304
+
+    # A reply from the other side changes the etag
+    client.post('/api/message/send', json={'receiver_username': 'etag1', 'message': 'Hi'}, headers=headers2)
+    response = client.get(f'/api/message/{str(user2.id)}', headers={**headers1, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.json['messages']) == 2
+
+
+def test_inbox_fields(client):
+    """Test ?fields= on the inbox"""
+    user1 = create_test_user('fields1@gmail.com', 'fields1')
+    user1.save()
+    user2 = create_test_user('fields2@gmail.com', 'fields2')
+    user2.save()
+    Message(sender=user2, receiver=user1, message='Hey', created_at=datetime(2024, 1, 1, 10, 0, 0)).save()
+    Message(sender=user1, receiver=user2, message='Hello back', created_at=datetime(2024, 1, 1, 11, 0, 0)).save()
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(user1.id))}'}
+
+    response = client.get('/api/message/inbox?fields=username,last_message', headers=headers)
+    assert response.status_code == 200
+    assert response.json['inbox'] == [{'username': 'fields2', 'last_message': 'Hello back'}]
+
+    response = client.get('/api/message/inbox?fields=password', headers=headers)
+    assert response.status_code == 400
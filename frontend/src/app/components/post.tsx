@@ -51,7 +51,7 @@ const Post = ({ data, postID }: PostData) => {
       </div>
 
       {/*Modal for Edit Option using postID={postID}*/}
-      {clickEdit && <Update open={clickEdit} setOpen={setCE} postID={postID} />}
+      {clickEdit && <Update open={clickEdit} setOpen={setCE} postID={postID} version={data.version} />}
 
       {/*Modal for Delete Option*/}
       {clickDelete && <Delete open={clickDelete} setOpen={setCD} postID={postID} />}
@@ -26,29 +26,40 @@ export default function ParkingBrowsePage() {
   const [maxDistanceMiles, setMaxDistanceMiles] = useState(5);
   const [selectedSpotId, setSelectedSpotId] = useState<string | null>(null);
 
-  // Fetch from Flask backend
+  const [bbox, setBbox] = useState<string | null>(null);
+
+  // Fetch from Flask backend, only the spots inside the visible map area
   useEffect(() => {
-    if (!isAuthenticated) return;
+    if (!isAuthenticated || !bbox) return;
 
+    let cancelled = false;
     const fetchSpots = async () => {
       try {
-        const res = await fetch("http://localhost:5001/api/parking/spots");
+        const res = await fetch(
+          `http://localhost:5001/api/parking/spots?bbox=${encodeURIComponent(bbox)}&limit=200`
+        );
         const data = await res.json();
 
         if (!res.ok) {
           throw new Error(data.error || "Failed to fetch spots");
         }
 
-        setSpots(data.spots || []);
+        if (!cancelled) {
+          setSpots(data.spots || []);
+          setError(null);
+        }
       } catch (err: any) {
-        setError(err.message);
+        if (!cancelled) setError(err.message);
       } finally {
-        setLoading(false);
+        if (!cancelled) setLoading(false);
       }
     };
 
     fetchSpots();
-  }, [isAuthenticated]);
+    return () => {
+      cancelled = true;
+    };
+  }, [isAuthenticated, bbox]);
 
   // Filter spots based on query only (not distance)
   const filteredSpots: Parking[] = useMemo(() => {
@@ -92,8 +103,6 @@ export default function ParkingBrowsePage() {
   const showReset = query.trim() !== "" || maxDistanceMiles !== 5;
 
   if (!isAuthenticated) return null; // or a loading spinner while redirecting
-  if (loading) return <p className="pt-20 text-center text-gray-600">Loading posts...</p>;
-  if (error) return <p className="pt-20 text-center text-red-600">Error: {error}</p>;
 
   return (
     <main className="mx-auto max-w-[1400px] px-4 pb-8 pt-20">
@@ -121,8 +130,15 @@ export default function ParkingBrowsePage() {
           showReset={showReset}
           maxDistanceMiles={maxDistanceMiles}
           selectedSpotId={selectedSpotId}
+          onBoundsChange={setBbox}
         />
-        {filteredSpots.length === 0 && (
+        {loading && (
+          <p className="mt-3 text-xs text-gray-500 text-center">Loading posts...</p>
+        )}
+        {error && (
+          <p className="mt-3 text-xs text-red-600 text-center">Error: {error}</p>
+        )}
+        {!loading && !error && filteredSpots.length === 0 && (
           <p className="mt-3 text-xs text-gray-500 text-center">
             No spots found nearby. Try adjusting your filters.
           </p>
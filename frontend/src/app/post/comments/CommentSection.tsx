@@ -13,48 +13,69 @@ const CommentSection = ({ postID, updates }: PostCommentSection) => {
   const [commentSection, setCommentSection] = useState<CommentInformation[]>([]);
   const [success, setSuccess] = useState(false);
   const [error, setError] = useState("");
+  const [nextBefore, setNextBefore] = useState<string | null>(null); // cursor for the next (older) page
 
-  useEffect(() => {
-    async function fetchCommentSection() {
-      try {
-        // Fetch token to make sure that the like button remains liked until the user unlike the comment
-        const token = localStorage.getItem("fms_token");
-        console.log("Current Token:", token); //log token for debugging
-        if (!token) {
-          setError("You must be logged in to like this post.");
-          return;
-        }
+  // fetches one page of comments, the newest one when before is null
+  async function fetchPage(before: string | null) {
+    try {
+      // Fetch token to make sure that the like button remains liked until the user unlike the comment
+      const token = localStorage.getItem("fms_token");
+      console.log("Current Token:", token); //log token for debugging
+      if (!token) {
+        setError("You must be logged in to like this post.");
+        return null;
+      }
 
-        const response = await fetch(`/api/comments/${postID}`, {
-          headers: {
-            Authorization: `Bearer ${token}`,
-            "Content-Type": "application/json",
-          },
-        });
+      const query = before ? `?before=${encodeURIComponent(before)}` : "";
+      const response = await fetch(`/api/comments/${postID}${query}`, {
+        headers: {
+          Authorization: `Bearer ${token}`,
+          "Content-Type": "application/json",
+        },
+      });
 
-        if (!response.ok) {
-          setError("An error regarding fetching has occurred");
-          setSuccess(false);
-          return;
-        }
+      if (!response.ok) {
+        setError("An error regarding fetching has occurred");
+        setSuccess(false);
+        return null;
+      }
 
-        const data = await response.json();
-        setCommentSection(data.comments || []);
+      const data = await response.json();
+      setNextBefore(data.next_before || null);
+      setSuccess(true);
+      return (data.comments || []) as CommentInformation[];
+    } catch (error: unknown) {
+      if (error instanceof Error) {
+        setError("Error: " + error.message);
+        setSuccess(false);
+      } else {
+        setError("An error has occurred.");
+        setSuccess(false);
+      }
+      return null;
+    }
+  }
 
-        setSuccess(true);
-      } catch (error: unknown) {
-        if (error instanceof Error) {
-          setError("Error: " + error.message);
-          setSuccess(false);
-        } else {
-          setError("An error has occurred.");
-          setSuccess(false);
-        }
+  useEffect(() => {
+    async function fetchCommentSection() {
+      const comments = await fetchPage(null);
+      if (comments) {
+        setCommentSection(comments);
       }
     }
     fetchCommentSection();
+    // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [postID, updates]);
 
+  // only the next older page is fetched and added below what is already shown
+  const loadOlder = async () => {
+    if (!nextBefore) return;
+    const comments = await fetchPage(nextBefore);
+    if (comments) {
+      setCommentSection((shown) => shown.concat(comments));
+    }
+  };
+
   setTimeout(() => {
     setSuccess(false);
   }, 2000);
@@ -87,6 +108,11 @@ const CommentSection = ({ postID, updates }: PostCommentSection) => {
           </div>
         ))}
       </div>
+      {nextBefore && (
+        <button className="text-sm text-gray-500 mt-2" onClick={loadOlder}>
+          Load older comments
+        </button>
+      )}
     </div>
   );
 };
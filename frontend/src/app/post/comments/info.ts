@@ -5,6 +5,9 @@ interface CommentInformation {
   created_at: string;
   like_count?: number;
   is_liked?: boolean;
+  reply_count?: number;
+  replies?: CommentInformation[]; // only from /replies, at most ?limit= per level
+  next_after?: string | null; // cursor for this comment's next page of replies
 }
 
 export default CommentInformation;
@@ -3,12 +3,16 @@ interface PostInfo {
   title?: string;
   owner?: string;
   url_for_images?: string;
+  image_variants?: { thumbnail: string; card: string; full: string } | null; // resized cloudinary urls
   address?: string;
   description?: string;
   tags: string[];
   time_created: string; // is time a string or a Date object in the backend
   like_count?: number;
+  comment_count?: number;
+  comment_preview?: { id: string; text: string; author: string; created_at: string }[]; // only with ?include=comment_preview
   is_liked?: boolean;
+  version?: number; // sent back with edits so two open edit forms cannot overwrite each other
 }
 
 export default PostInfo;
@@ -8,40 +8,59 @@ import { Input } from "@headlessui/react";
 import { IoIosSearch } from "react-icons/io";
 import { motion } from "motion/react";
 
+const PAGE_SIZE = 24; // posts per page, more are loaded on demand
+
 const Gallery = () => {
   const [posts, setPosts] = useState<PostInfo[]>([]); // our posts from the db
   const [error, setError] = useState("");
   const [success, setSuccess] = useState(false);
   const [search, setSearch] = useState("");
 
-  useEffect(() => {
-    async function getPost() {
-      try {
-        const response = await fetch(`http://localhost:5001/api/parking/spots`);
-        if (!response.ok) {
-          setError("An error regarding fetching the posts has occurred");
-        }
+  const [nextCursor, setNextCursor] = useState<string | null>(null); // cursor for the next page of posts
+  const [loadingMore, setLoadingMore] = useState(false);
 
-        const data = await response.json();
-        if (!data) {
-          setError("An error has occurred for getting the posts");
-        }
+  // fetch one page of posts, the latest comments come with each post
+  async function getPost(cursor: string | null) {
+    try {
+      const query = cursor ? `&cursor=${encodeURIComponent(cursor)}` : "";
+      const response = await fetch(`http://localhost:5001/api/parking/spots?limit=${PAGE_SIZE}&include=comment_preview${query}`);
+      if (!response.ok) {
+        setError("An error regarding fetching the posts has occurred");
+        return;
+      }
 
-        setPosts(data.spots || []);
-        setSuccess(true);
-      } catch (error: unknown) {
-        if (error instanceof Error) {
-          setError("Error: " + error.message);
-          setSuccess(false);
-        } else {
-          setError("An error has occurred.");
-          setSuccess(false);
-        }
+      const data = await response.json();
+      if (!data) {
+        setError("An error has occurred for getting the posts");
+        return;
+      }
+
+      // later pages are appended, the first page replaces whatever was shown
+      setPosts((prev) => (cursor ? prev.concat(data.spots || []) : data.spots || []));
+      setNextCursor(data.next_cursor || null);
+      setSuccess(true);
+    } catch (error: unknown) {
+      if (error instanceof Error) {
+        setError("Error: " + error.message);
+        setSuccess(false);
+      } else {
+        setError("An error has occurred.");
+        setSuccess(false);
       }
     }
-    getPost();
+  }
+
+  useEffect(() => {
+    getPost(null);
   }, []);
 
+  const handleLoadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    await getPost(nextCursor);
+    setLoadingMore(false);
+  };
+
   const handleSearch = (e: React.ChangeEvent<HTMLInputElement>) => {
     setSearch(e.target.value);
   };
@@ -112,7 +131,7 @@ const Gallery = () => {
             >
               <Link key={post.id} href={`/post/${post.id}`} className="rounded-md shadow-gray-400 cursor-pointer">
                 <div className="relative w-full aspect-square rounded-t-md bg-gray-200">
-                  <Image src={post.url_for_images || "/images/default-avatar.png"} alt={post.title || "Post image"} fill className="object-cover" />
+                  <Image src={post.image_variants?.card || post.url_for_images || "/images/default-avatar.png"} alt={post.title || "Post image"} fill className="object-cover" />
                 </div>
                 <div key={post.id} className="p-4 rounded shadow">
                   <h3 className="font-bold text-lg">{post.title}</h3>
@@ -124,6 +143,15 @@ const Gallery = () => {
                       </span>
                     ))}
                   </div>
+                  {post.comment_preview && post.comment_preview.length > 0 && (
+                    <div className="mt-2 space-y-1 text-xs text-gray-600">
+                      {post.comment_preview.map((comment) => (
+                        <p key={comment.id} className="truncate">
+                          <span className="font-semibold">{comment.author}</span> {comment.text}
+                        </p>
+                      ))}
+                    </div>
+                  )}
                 </div>
               </Link>
             </motion.div>
@@ -132,6 +160,13 @@ const Gallery = () => {
       ) : (
         error && <div className="flex items-center text-red-600"> {error}</div>
       )}
+      {success && nextCursor && (
+        <div className="flex justify-center mb-8">
+          <button onClick={handleLoadMore} disabled={loadingMore} className="border rounded-sm px-4 py-2 text-sm hover:shadow-md disabled:opacity-50">
+            {loadingMore ? "Loading..." : "Load more"}
+          </button>
+        </div>
+      )}
       {/*Else, return an error message*/}
     </div>
   );
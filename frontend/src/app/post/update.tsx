@@ -8,6 +8,7 @@ interface UpdateModal {
   open: boolean;
   setOpen: (value: boolean) => void;
   postID: string;
+  version?: number; // version of the post this form was opened on
 }
 
 interface updateInfo {
@@ -15,9 +16,10 @@ interface updateInfo {
   url_for_images?: string;
   description?: string;
   tags?: string;
+  version?: number;
 }
 
-const Update = ({ open, setOpen, postID }: UpdateModal) => {
+const Update = ({ open, setOpen, postID, version }: UpdateModal) => {
   // api logic for updating a post
   const [title, setTitle] = useState("");
   const [image, setImage] = useState<File | null>(null);
@@ -125,6 +127,11 @@ const Update = ({ open, setOpen, postID }: UpdateModal) => {
       updateForm.tags = tags;
     }
 
+    // the backend answers 409 when the post changed since it was loaded
+    if (version !== undefined) {
+      updateForm.version = version;
+    }
+
     // Updating the post using PUT to the backend
     try {
       const response = await fetch(`/api/parking/update-post/${postID}`, {
@@ -136,6 +143,11 @@ const Update = ({ open, setOpen, postID }: UpdateModal) => {
         body: JSON.stringify(updateForm),
       });
 
+      if (response.status === 409) {
+        setError("This post was changed somewhere else. Reload the page and make your edit again.");
+        return;
+      }
+
       if (!response.ok) {
         setError("An error regarding fetching has occurred");
         return;
@@ -13,6 +13,7 @@ interface MapViewProps {
   showReset?: boolean;
   maxDistanceMiles: number; // For controlling zoom level
   selectedSpotId?: string | null; // For zooming to selected search result
+  onBoundsChange?: (bbox: string) => void; // Called with "min_lng,min_lat,max_lng,max_lat" after the view moves
 }
 
 export default function MapView({
@@ -22,11 +23,14 @@ export default function MapView({
   showReset = false,
   maxDistanceMiles,
   selectedSpotId = null,
+  onBoundsChange,
 }: MapViewProps) {
   const mapRef = useRef<HTMLDivElement | null>(null);
   const mapInstance = useRef<any | null>(null);
   const markersRef = useRef<any[]>([]);
   const [L, setL] = useState<any | null>(null);
+  const onBoundsChangeRef = useRef(onBoundsChange);
+  onBoundsChangeRef.current = onBoundsChange;
 
   // Load Leaflet dynamically (client only)
   useEffect(() => {
@@ -72,6 +76,18 @@ export default function MapView({
 
     mapInstance.current = map;
 
+    // Report the visible area so the page only loads the spots on screen
+    const reportBounds = () => {
+      const b = map.getBounds();
+      onBoundsChangeRef.current?.(
+        [b.getWest(), b.getSouth(), b.getEast(), b.getNorth()]
+          .map((v: number) => v.toFixed(5))
+          .join(",")
+      );
+    };
+    map.on("moveend", reportBounds);
+    reportBounds();
+
     return () => {
       // Clean up all markers first
       markersRef.current.forEach((m) => {
@@ -154,7 +170,7 @@ export default function MapView({
       adjustedPositions.push({ lat: displayLat, lng: displayLng });
 
       // Fallbacks for missing backend fields
-      const avatarSrc = (p as any).url_for_images ?? "/images/default-avatar.svg";
+      const avatarSrc = p.image_variants?.thumbnail ?? (p as any).url_for_images ?? "/images/default-avatar.svg";
       const userName = (p as any).owner ?? "Unknown User";
       const address = p.address ?? "No address available";
       const title = p.title ?? "Untitled Post";
@@ -224,29 +240,6 @@ export default function MapView({
       bounds.extend([displayLat, displayLng]);
     });
 
-    // Always show all markers, but zoom based on the selected distance
-    if (adjustedPositions.length > 0) {
-      // Calculate zoom level based on maxDistanceMiles
-      // Smaller distance = closer zoom, larger distance = wider zoom
-      let zoomLevel: number;
-      if (maxDistanceMiles <= 1) {
-        zoomLevel = 15; // Very close zoom for 1 mile
-      } else if (maxDistanceMiles <= 5) {
-        zoomLevel = 13; // Medium-close zoom for 5 miles
-      } else if (maxDistanceMiles <= 10) {
-        zoomLevel = 12; // Medium zoom for 10 miles
-      } else if (maxDistanceMiles <= 20) {
-        zoomLevel = 11; // Medium-wide zoom for 20 miles
-      } else {
-        zoomLevel = 10; // Wide zoom for 50+ miles
-      }
-
-      console.log(`MapView: Setting zoom to ${zoomLevel} for ${maxDistanceMiles} miles view`);
-      
-      // Center on UC Riverside and set zoom
-      map.setView([33.9730, -117.3325], zoomLevel, { animate: true });
-    }
-
     // Cleanup function
     return () => {
       markersRef.current.forEach((m) => {
@@ -260,7 +253,34 @@ export default function MapView({
         }
       });
     };
-  }, [L, spots, onMarkerClick, maxDistanceMiles]);
+  }, [L, spots, onMarkerClick]);
+
+  // Zoom based on the selected distance. Kept apart from the markers so a
+  // refetch after the view moves does not snap the map back.
+  useEffect(() => {
+    const map = mapInstance.current;
+    if (!map || !L) return;
+
+    // Calculate zoom level based on maxDistanceMiles
+    // Smaller distance = closer zoom, larger distance = wider zoom
+    let zoomLevel: number;
+    if (maxDistanceMiles <= 1) {
+      zoomLevel = 15; // Very close zoom for 1 mile
+    } else if (maxDistanceMiles <= 5) {
+      zoomLevel = 13; // Medium-close zoom for 5 miles
+    } else if (maxDistanceMiles <= 10) {
+      zoomLevel = 12; // Medium zoom for 10 miles
+    } else if (maxDistanceMiles <= 20) {
+      zoomLevel = 11; // Medium-wide zoom for 20 miles
+    } else {
+      zoomLevel = 10; // Wide zoom for 50+ miles
+    }
+
+    console.log(`MapView: Setting zoom to ${zoomLevel} for ${maxDistanceMiles} miles view`);
+
+    // Center on UC Riverside and set zoom
+    map.setView([33.9730, -117.3325], zoomLevel, { animate: true });
+  }, [L, maxDistanceMiles]);
 
   // Zoom to selected spot from search
   useEffect(() => {
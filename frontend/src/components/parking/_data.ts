@@ -274,6 +274,7 @@ export interface Parking {
   address: string;
   description?: string;
   url_for_images?: string;
+  image_variants?: { thumbnail: string; card: string; full: string } | null;
   tags?: string[];
   lat?: number;
   lng?: number;
@@ -125,39 +125,10 @@ const Create = () => {
       }
     }
 
-    //geocoding: Convert address to coordinates
-    let lat = null;
-    let lng = null;
-
-    try {
-      const geocodeResponse = await fetch(`https://nominatim.openstreetmap.org/search?format=json&q=${encodeURIComponent(address)}`, {
-        headers: {
-          "User-Agent": "ParkingApp/1.0", //required by nominatim usage policy
-        },
-      });
-
-      if (geocodeResponse.ok) {
-        const geocodeData = await geocodeResponse.json();
-        if (geocodeData && geocodeData.length > 0) {
-          lat = parseFloat(geocodeData[0].lat);
-          lng = parseFloat(geocodeData[0].lon);
-        } else {
-          setError("Address not found. Please try a more specific address.");
-          return;
-        }
-      } else {
-        console.error("Geocoding failed");
-        setError("Could not validate address. Please check your internet connection.");
-        return;
-      }
-    } catch (error) {
-      console.error("Geocoding error:", error);
-      setError("Error validating address.");
-      return;
-    }
+    //coordinates are looked up from the address by the backend
 
     // postSubmission is the post's info to be sent
-    const postSubmission = { title: title.trim(), url_for_images: urlImage, address, description, tags, lat, lng };
+    const postSubmission = { title: title.trim(), url_for_images: urlImage, address, description, tags };
 
     // Posting the post submission to the backend
     try {